@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib
+import os
+import time
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                wait)
+
+from typing import Sequence
+
+stage_list = ['ddi', 'wav', 'frm2', 'rename']
+stage_script = {
+    'ddi': 'extract_ddi',
+    'wav': 'extract_wav',
+    'frm2': 'extract_frm2',
+    'rename': 'rename_wav',
+}
+stage_deps = {
+    'ddi': [],
+    'wav': [],
+    'frm2': [],
+    'rename': ['ddi', 'wav'],
+}
+
+
+class Job:
+    # one script main() run on one bank, memory is a rough peak estimate
+    def __init__(self, bank: str, stage: str, args: list[str], memory: int):
+        self.bank = bank
+        self.stage = stage
+        self.args = args
+        self.memory = memory
+        self.deps = [(bank, dep) for dep in stage_deps[stage]]
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.bank, self.stage
+
+
+def parse_args(args: Sequence[str] = None
+               ) -> tuple[str, list[str], int, int, str | None, bool]:
+    # initialize parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', required=True,
+                        help='directory searched recursively for '
+                        'ddi/ddb pairs')
+    parser.add_argument('--stages', nargs='+', choices=stage_list,
+                        default=['ddi', 'wav', 'rename'],
+                        help='stages run on every bank, '
+                        'default to be "ddi wav rename"')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of jobs running at the same time, '
+                        'default to be the number of cpus')
+    parser.add_argument('--memory_budget', type=int, default=4096,
+                        help='estimated memory of the running jobs in MB, '
+                        'default to be 4096')
+    parser.add_argument('--cache_dir',
+                        help='parse cache directory of the ddi files, '
+                        'see extract_ddi.py')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print the progress of every sample')
+
+    # parse args
+    args_result = parser.parse_args(args)
+    root: str = os.path.normpath(args_result.root)
+    assert os.path.isdir(root)
+    assert args_result.jobs >= 1 and args_result.memory_budget >= 1
+    return (root, args_result.stages, args_result.jobs,
+            args_result.memory_budget << 20, args_result.cache_dir,
+            args_result.quiet)
+
+
+def find_banks(root: str) -> list[str]:
+    # bank paths without extension, for every ddi with a ddb next to it
+    bank_list: list[str] = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            bank, ext = os.path.splitext(os.path.join(dir_path, file_name))
+            if ext == '.ddi' and os.path.isfile(bank+'.ddb'):
+                bank_list.append(bank)
+    return bank_list
+
+
+def bank_jobs(bank: str, stages: list[str], cache_dir: str = None,
+              quiet: bool = False) -> list[Job]:
+    # Peak memory estimates: parsing holds the ddi and its parsed tree,
+    # the ddb scans keep at most a few release_step windows resident.
+    ddi_size = os.path.getsize(bank+'.ddi')
+    quiet_args = ['--quiet'] if quiet else []
+    cache_args = [] if cache_dir is None else ['--cache_dir', cache_dir]
+    job_list: list[Job] = []
+    for stage in stages:
+        if stage == 'ddi':
+            job_list.append(Job(bank, stage, ['--src_path', bank+'.ddi',
+                                              *cache_args],
+                                (32 << 20)+40*ddi_size))
+        elif stage == 'wav':
+            job_list.append(Job(bank, stage, ['--src_path', bank+'.ddb',
+                                              *quiet_args], 160 << 20))
+        elif stage == 'frm2':
+            job_list.append(Job(bank, stage, ['--src_path', bank+'.ddb',
+                                              *quiet_args], 160 << 20))
+        elif stage == 'rename':
+            job_list.append(Job(bank, stage, ['--work_dir', bank,
+                                              *quiet_args],
+                                (32 << 20)+40*ddi_size))
+    # a stage only waits for the stages that are scheduled as well
+    for job in job_list:
+        job.deps = [dep for dep in job.deps if dep[1] in stages]
+    return job_list
+
+
+def run_job(script: str, args: list[str]) -> float:
+    # runs in a pool process, the scripts are imported once per process
+    start = time.perf_counter()
+    try:
+        importlib.import_module(script).main(args)
+    except SystemExit as e:
+        # argparse exits on bad arguments, the job fails but the scheduler
+        # goes on with the others
+        if e.code not in (None, 0):
+            raise RuntimeError(f'{script} exited with {e.code}') from None
+    return time.perf_counter()-start
+
+
+def run_jobs(job_list: list[Job], jobs: int, memory_budget: int
+             ) -> tuple[int, int]:
+    # Jobs start in order as soon as their dependencies are done, while
+    # fewer than `jobs` are running and their estimates fit in the budget.
+    # A job larger than the budget still runs, alone.
+    pending = list(job_list)
+    running: dict[Future, Job] = {}
+    done: set[tuple[str, str]] = set()
+    failed: set[tuple[str, str]] = set()
+    memory = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for job in list(pending):
+                if any(dep in failed for dep in job.deps):
+                    print(f'skipped: {job.bank} {job.stage}')
+                    failed.add(job.key)
+                    pending.remove(job)
+                    continue
+                if len(running) >= jobs:
+                    break
+                if not all(dep in done for dep in job.deps):
+                    continue
+                if running and memory+job.memory > memory_budget:
+                    continue
+                future = executor.submit(run_job, stage_script[job.stage],
+                                         job.args)
+                running[future] = job
+                memory += job.memory
+                pending.remove(job)
+            if not running:
+                continue
+            finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = running.pop(future)
+                memory -= job.memory
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    print(f'failed: {job.bank} {job.stage}: {e!r}')
+                    failed.add(job.key)
+                    continue
+                print(f'done: {job.bank} {job.stage} in {seconds:.2f} s')
+                done.add(job.key)
+    return len(done), len(failed)
+
+
+def main(args: Sequence[str] = None):
+    root, stages, jobs, memory_budget, cache_dir, quiet = parse_args(args)
+    bank_list = find_banks(root)
+    print(f'{len(bank_list)} banks found under: ', root)
+    job_list = [job for bank in bank_list
+                for job in bank_jobs(bank, stages, cache_dir, quiet)]
+    done_num, failed_num = run_jobs(job_list, jobs, memory_budget)
+    print(f'{done_num} jobs done, {failed_num} failed or skipped')
+
+
+if __name__ == '__main__':
+    main()
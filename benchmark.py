@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+from utils.ddi_utils import read_ddi
+from utils.stats_utils import stats
+from utils.synth_utils import synth_bank
+import extract_frm2
+import extract_wav
+import rename_wav
+import argparse
+import contextlib
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+import traceback
+import zipfile
+
+from typing import Callable, Sequence
+
+stage_list = ['read_ddi', 'extract_wav', 'extract_frm2', 'rename_wav']
+
+
+def parse_args(args: Sequence[str] = None
+               ) -> tuple[str | None, int, list[str], int]:
+    # initialize parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--work_dir',
+                        help='directory of the synthetic bank and outputs, '
+                        'default to be a temporary directory')
+    parser.add_argument('--scale', type=int, default=10,
+                        help='bank size, 64 samples per unit, '
+                        'default to be 10')
+    parser.add_argument('--stages', nargs='+', choices=stage_list,
+                        default=stage_list,
+                        help='stages to run, default to be all of them')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per stage, the fastest one is reported, '
+                        'default to be 3')
+
+    # parse args
+    args_result = parser.parse_args(args)
+    assert args_result.scale >= 1 and args_result.repeat >= 1
+    return (args_result.work_dir, args_result.scale,
+            args_result.stages, args_result.repeat)
+
+
+def run_read_ddi(ddi_path: str, ddb_path: str, dst_dir: str
+                 ) -> tuple[int, int]:
+    with open(ddi_path, 'rb') as ddi_f:
+        ddi_bytes = ddi_f.read()
+    ddi_data_dict = read_ddi(ddi_bytes, dst_dir)
+    return len(ddi_bytes), sum(len(name_list)
+                               for part_dict in ddi_data_dict.values()
+                               for name_list in part_dict.values())
+
+
+def run_extract_wav(ddi_path: str, ddb_path: str, dst_dir: str
+                    ) -> tuple[int, int]:
+    # every run extracts all the samples, not only the ones missing from
+    # the manifest of the previous run
+    dst_path = os.path.join(dst_dir, 'wav.zip')
+    extract_wav.main(['--src_path', ddb_path, '--dst_path', dst_path,
+                      '--restart'])
+    with zipfile.ZipFile(dst_path) as zip_f:
+        return os.path.getsize(ddb_path), len(zip_f.infolist())
+
+
+def run_extract_frm2(ddi_path: str, ddb_path: str, dst_dir: str
+                     ) -> tuple[int, int]:
+    dst_path = os.path.join(dst_dir, 'frm2.zip')
+    extract_frm2.main(['--src_path', ddb_path, '--dst_path', dst_path])
+    with zipfile.ZipFile(dst_path) as zip_f:
+        return os.path.getsize(ddb_path), len(zip_f.infolist())
+
+
+def run_rename_wav(ddi_path: str, ddb_path: str, dst_dir: str
+                   ) -> tuple[int, int]:
+    # needs the ddi.yml and wav.zip of the previous stages
+    rename_wav.main(['--work_dir', dst_dir])
+    with zipfile.ZipFile(os.path.join(dst_dir, 'wav_renamed.zip')) as zip_f:
+        return (os.path.getsize(os.path.join(dst_dir, 'wav.zip')),
+                len(zip_f.infolist()))
+
+
+stage_fn: dict[str, Callable[[str, str, str], tuple[int, int]]] = {
+    'read_ddi': run_read_ddi,
+    'extract_wav': run_extract_wav,
+    'extract_frm2': run_extract_frm2,
+    'rename_wav': run_rename_wav,
+}
+
+
+def run_stage(stage: str, ddi_path: str, ddb_path: str, dst_dir: str,
+              result_queue: multiprocessing.Queue) -> None:
+    # Runs in a fresh process, so the peak memory is the one of this stage
+    # only. Puts (error, result), the traceback text if the stage failed.
+    try:
+        with open(os.devnull, 'w') as null_f, \
+                contextlib.redirect_stdout(null_f):
+            start = time.perf_counter()
+            size, records = stage_fn[stage](ddi_path, ddb_path, dst_dir)
+            seconds = time.perf_counter()-start
+    except BaseException:
+        # reported by bench_stage
+        result_queue.put((traceback.format_exc(), None))
+        return
+    result_queue.put((None, (seconds, size, records, stats.peak_memory())))
+
+
+def bench_stage(stage: str, ddi_path: str, ddb_path: str, dst_dir: str
+                ) -> tuple[float, int, int, int | None] | None:
+    # None if the stage failed, the reason is printed
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=run_stage, args=(stage, ddi_path, ddb_path,
+                                                  dst_dir, result_queue))
+    process.start()
+    message = None
+    while message is None:
+        try:
+            message = result_queue.get(timeout=1)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+            # a message put just before the exit may still be in the pipe
+            try:
+                message = result_queue.get(timeout=1)
+            except queue.Empty:
+                message = (f'exited with code {process.exitcode}\n', None)
+    process.join()
+    error, result = message
+    if error is not None or process.exitcode != 0:
+        print(f'{stage} failed: {error or process.exitcode}')
+        return None
+    return result
+
+
+def main(args: Sequence[str] = None):
+    work_dir, scale, stages, repeat = parse_args(args)
+    with contextlib.ExitStack() as exit_stack:
+        if work_dir is None:
+            work_dir = exit_stack.enter_context(tempfile.TemporaryDirectory())
+        ddi_path, ddb_path = synth_bank(work_dir, scale)
+        dst_dir = os.path.join(work_dir, 'bank')
+        os.makedirs(dst_dir, exist_ok=True)
+        print(f'ddi: {os.path.getsize(ddi_path)/1e6:.2f} MB, '
+              f'ddb: {os.path.getsize(ddb_path)/1e6:.2f} MB')
+
+        print(f'{"stage":<14}{"seconds":>10}{"MB/s":>10}'
+              f'{"records/s":>12}{"peak MB":>10}')
+        for stage in stages:
+            result_list = []
+            for i in range(repeat):
+                if (result := bench_stage(stage, ddi_path, ddb_path,
+                                          dst_dir)) is None:
+                    break
+                result_list.append(result)
+            if len(result_list) < repeat:
+                continue
+            seconds, size, records, peak = min(result_list,
+                                               key=lambda x: x[0])
+            # no peak memory where resource is not available (Windows)
+            peak_str = '-' if peak is None else f'{peak/1e6:.1f}'
+            print(f'{stage:<14}{seconds:>10.3f}{size/1e6/seconds:>10.1f}'
+                  f'{records/seconds:>12.0f}{peak_str:>10}')
+
+
+if __name__ == '__main__':
+    main()
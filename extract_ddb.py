@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+from utils.ddb_utils import frm2_encode, open_ddb, snd_encode
+from utils.scan_utils import DdbScanner, Frm2ZipSink, WavZipSink, stats_sink
+from utils.stats_utils import stats
+from utils.zip_utils import ResumableZip, compression_types
+import argparse
+import mmap
+import os
+import time
+import zipfile
+
+from typing import Sequence
+
+
+def parse_args(args: Sequence[str] = None
+               ) -> tuple[str, str, str, bool, int, int, str | None, bool]:
+    # initialize parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--src_path', required=True,
+                        help='source ddb file path')
+    parser.add_argument('--wav_path',
+                        help='destination wav zip path, '
+                        'default to be "./[name]/wav.zip"')
+    parser.add_argument('--frm2_path',
+                        help='destination frm2 zip path, '
+                        'default to be "./[name]/frm2.zip"')
+    parser.add_argument('--compression', choices=compression_types.keys(),
+                        default='stored',
+                        help='compression of the zip entries, '
+                        'default to be stored')
+    parser.add_argument('--compress_level', type=int, default=6,
+                        help='deflate level from 0 to 9 '
+                        'when "compression" is deflate, default to be 6')
+    parser.add_argument('--restart', action='store_true',
+                        help='extract every sample again, instead of keeping '
+                        'the ones already in wav.zip according to its '
+                        'manifest')
+    parser.add_argument('--stats',
+                        help='write wall time, bytes and records per stage '
+                        'and the peak memory to this json file')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print the progress of every chunk')
+
+    # parse args
+    args_result = parser.parse_args(args)
+    src_path: str = os.path.normpath(args_result.src_path)
+    src_dir, src_filename = os.path.split(src_path)
+    src_name, src_ext = os.path.splitext(src_filename)
+    wav_path: str = args_result.wav_path
+    if wav_path is None:
+        wav_path = os.path.join(src_dir, src_name, 'wav.zip')
+    wav_path = os.path.normpath(wav_path)
+    frm2_path: str = args_result.frm2_path
+    if frm2_path is None:
+        frm2_path = os.path.join(src_dir, src_name, 'frm2.zip')
+    frm2_path = os.path.normpath(frm2_path)
+    assert wav_path.endswith('.zip') and frm2_path.endswith('.zip')
+    assert wav_path != frm2_path
+
+    # make dirs
+    for dst_path in (wav_path, frm2_path):
+        dir_path = os.path.dirname(dst_path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+    compression = compression_types[args_result.compression]
+    compress_level: int = args_result.compress_level
+    assert 0 <= compress_level <= 9
+    return (src_path, wav_path, frm2_path, args_result.restart, compression,
+            compress_level, args_result.stats, args_result.quiet)
+
+
+def main(args: Sequence[str] = None):
+    (src_path, wav_path, frm2_path, restart, compression,
+     compress_level, stats_path, quiet) = parse_args(args)
+    stats.clear()
+    stats.quiet = quiet
+    with open_ddb(src_path) as ddb_data, open(src_path, 'rb') as ddb_f:
+        # entries are stamped with the ddb mtime to keep the zip
+        # reproducible
+        date_time = time.localtime(os.fstat(ddb_f.fileno()).st_mtime)[:6]
+        with stats.timer('extract_ddb', size=len(ddb_data)):
+            extract_ddb(ddb_data, wav_path, frm2_path, date_time,
+                        resume=not restart, compression=compression,
+                        compress_level=compress_level,
+                        add_stats=stats_path is not None)
+    if stats_path is not None:
+        stats.dump(stats_path)
+
+
+def extract_ddb(ddb_data: mmap.mmap | bytes, wav_path: str, frm2_path: str,
+                date_time: tuple[int, int, int, int, int, int] = None,
+                resume: bool = True, compression: int = zipfile.ZIP_STORED,
+                compress_level: int = None, add_stats: bool = False):
+    # wav.zip and frm2.zip of the same single walk over the ddb
+    length = len(ddb_data)
+    wav_f = ResumableZip(wav_path, resume=resume, compression=compression,
+                         compress_level=compress_level)
+    try:
+        frm2_f = zipfile.ZipFile(frm2_path, 'w', compression=compression,
+                                 compresslevel=compress_level)
+    except BaseException:
+        wav_f.abort()
+        raise
+    scanner = DdbScanner(ddb_data)
+    scanner.add_sink(snd_encode, WavZipSink(wav_f, length, date_time))
+    scanner.add_sink(frm2_encode, Frm2ZipSink(frm2_f, length))
+    if add_stats:
+        scanner.add_sink(snd_encode, stats_sink('snd'))
+        scanner.add_sink(frm2_encode, stats_sink('frm2'))
+    try:
+        scanner.scan()
+    except BaseException:
+        # the samples written so far are kept for the next run
+        wav_f.abort()
+        frm2_f.close()
+        raise
+    wav_f.close()
+    frm2_f.close()
+    print('zip file saved at: ', wav_path)
+    print('zip file saved at: ', frm2_path)
+
+
+if __name__ == '__main__':
+    main()
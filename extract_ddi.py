@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 
-from utils.ddi_utils import read_ddi
+from utils.ddi_utils import ddi_formats, read_ddi
+from utils.stats_utils import stats
 import argparse
 import os
 
 
-def parse_args(args: list[str] = None) -> tuple[str, str, bool, bool]:
+def parse_args(args: list[str] = None
+               ) -> tuple[str, str, bool, bool, str | None, str,
+                          str | None, int]:
     # initialize parser
     parser = argparse.ArgumentParser()
     parser.add_argument('--src_path', required=True,
@@ -14,26 +17,47 @@ def parse_args(args: list[str] = None) -> tuple[str, str, bool, bool]:
                         help='save temp files')
     parser.add_argument('--cat_only', action='store_true',
                         help='only concat ddi.yml, assuming temp files exist.')
+    parser.add_argument('--cache_dir',
+                        help='parse cache directory, entries are keyed by '
+                        'the PHDC hash and invalidated by file size and mtime')
+    parser.add_argument('--format', choices=ddi_formats.keys(), default='yaml',
+                        help='output format of ddi.yml/ddi.json/ddi.bin, '
+                        'default to be yaml')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes parsing the ART blocks, '
+                        'default to be 1')
+    parser.add_argument('--stats',
+                        help='write wall time, bytes and records per stage '
+                        'and the peak memory to this json file')
 
     # parse args
     args = parser.parse_args(args)
     src_path: str = os.path.normpath(args.src_path)
     assert os.path.isfile(src_path)
+    assert args.workers >= 1
 
     src_dir, src_filename = os.path.split(src_path)
     src_name, src_ext = os.path.splitext(src_filename)
     dst_path = os.path.join(src_dir, src_name)
     if not os.path.isdir(dst_path):
         os.makedirs(dst_path)
-    return src_path, dst_path, args.save_temp, args.cat_only
+    return (src_path, dst_path, args.save_temp, args.cat_only,
+            args.cache_dir, args.format, args.stats, args.workers)
 
 
-def main():
-    src_path, dst_path, save_temp, cat_only = parse_args()
+def main(args: list[str] = None):
+    (src_path, dst_path, save_temp, cat_only,
+     cache_dir, ddi_format, stats_path, workers) = parse_args(args)
+    stats.clear()
     with open(src_path, 'rb') as ddi_f:
         ddi_bytes = ddi_f.read()
+        mtime = os.fstat(ddi_f.fileno()).st_mtime_ns
     read_ddi(ddi_bytes, dst_path,
-             save_temp=save_temp, cat_only=cat_only)
+             save_temp=save_temp, cat_only=cat_only,
+             cache_dir=cache_dir, mtime=mtime, ddi_format=ddi_format,
+             src_path=src_path, workers=workers)
+    if stats_path is not None:
+        stats.dump(stats_path)
 
 
 if __name__ == '__main__':
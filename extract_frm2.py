@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 
+from utils.ddb_utils import frm2_encode, iter_chunk, open_ddb
+from utils.pool_utils import imap_ordered
+from utils.scan_utils import Frm2ZipSink
+from utils.stats_utils import stats
+from utils.zip_utils import compression_types, deflate_entry
 import argparse
 import os
 import zipfile
 
-start_encode = 'FRM2'.encode()
-
 
 def parse_args(args=None):  # : list[str]
     # initialize parser
@@ -14,7 +17,25 @@ def parse_args(args=None):  # : list[str]
                         help='source ddb file path')
     parser.add_argument('--dst_path',
                         help='destination extract path, '
-                        'default to be "./[name]/frm2.zip"')
+                        'default to be "./[name]/frm2.zip (frm2.npz)"')
+    parser.add_argument('--npz', action='store_true',
+                        help='decode all frames into one columnar frm2.npz '
+                        'instead of a zip of raw chunks, needs numpy')
+    parser.add_argument('--compression', choices=compression_types.keys(),
+                        default='stored',
+                        help='compression of the zip entries, '
+                        'default to be stored')
+    parser.add_argument('--compress_level', type=int, default=6,
+                        help='deflate level from 0 to 9 '
+                        'when "compression" is deflate, default to be 6')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of threads compressing the entries, '
+                        'default to be 1')
+    parser.add_argument('--stats',
+                        help='write wall time, bytes and records per stage '
+                        'and the peak memory to this json file')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print the progress of every frame')
 
     # parse args
     args = parser.parse_args(args)
@@ -23,48 +44,69 @@ def parse_args(args=None):  # : list[str]
     if dst_path is None:
         src_dir, src_filename = os.path.split(src_path)
         src_name, src_ext = os.path.splitext(src_filename)
-        dst_filename = 'frm2.zip'
+        dst_filename = 'frm2.npz' if args.npz else 'frm2.zip'
         dst_path = os.path.join(src_dir, src_name, dst_filename)
     dst_path: str = os.path.normpath(dst_path)
-    assert dst_path.endswith('.zip')
+    assert dst_path.endswith('.npz' if args.npz else '.zip')
 
     # make dirs
     dir_path = os.path.dirname(dst_path)
     if dir_path and not os.path.exists(dir_path):
         os.makedirs(dir_path)
 
-    return src_path, dst_path
-
-
-def main():
-    src_path, dst_path = parse_args()
-    with open(src_path, 'rb') as ddb_f:
-        ddb_data = ddb_f.read()
-    length = len(ddb_data)
-
-    zip_f = zipfile.ZipFile(dst_path, 'w', compression=zipfile.ZIP_STORED)
-
-    counter = 0
-    offset = 0
-    while(True):
-        if (start_idx := ddb_data.find(start_encode, offset)) == -1:
-            break
-
-        file_length = int.from_bytes(ddb_data[start_idx+4:start_idx+8],
-                                     byteorder='little')
-        offset = start_idx+file_length
-        if offset > length:
-            break
-        frm2_data = ddb_data[start_idx: offset]
-
-        counter += 1
-        print(f'{counter:<10d} progress: {offset:0>8x} / {length:0>8x}')
-
-        file_path = f'frm2/{start_idx:0>8x}.frm2'
-        zip_f.writestr(file_path, frm2_data)
-        print('    frm2 saved at: ', file_path)
-    zip_f.close()
-    print('zip file saved at: ', dst_path)
+    assert 0 <= args.compress_level <= 9 and args.workers >= 1
+    return (src_path, dst_path, args.npz, args.stats, args.quiet,
+            compression_types[args.compression], args.compress_level,
+            args.workers)
+
+
+def main(args=None):
+    (src_path, dst_path, npz, stats_path, quiet,
+     compression, compress_level, workers) = parse_args(args)
+    stats.clear()
+    stats.quiet = quiet
+    with open_ddb(src_path) as ddb_data:
+        length = len(ddb_data)
+
+        if npz:
+            from utils.npy_utils import decode_frm2, save_frm2
+            with stats.timer('scan', size=length):
+                offsets = [start_idx for start_idx, frm2_data
+                           in iter_chunk(ddb_data, frm2_encode)]
+            with stats.timer('decode_frm2', records=len(offsets)):
+                frames, data = decode_frm2(ddb_data, offsets)
+            with stats.timer('save_frm2', size=data.nbytes):
+                save_frm2(dst_path, frames, data)
+            print(f'{len(frames)} frames saved at: ', dst_path)
+        else:
+            zip_f = zipfile.ZipFile(dst_path, 'w', compression=compression,
+                                    compresslevel=compress_level)
+            chunk_iter = iter_chunk(ddb_data, frm2_encode)
+            if compression != zipfile.ZIP_STORED and workers > 1:
+                def deflate_frm2(frm2: tuple[int, bytes]
+                                 ) -> tuple[int, bytes, tuple]:
+                    start_idx, frm2_data = frm2
+                    return start_idx, frm2_data, deflate_entry(
+                        f'frm2/{start_idx:0>8x}.frm2', [frm2_data],
+                        compress_level=compress_level)
+                # the chunks are copied, a view of iter_chunk does not
+                # outlive its iteration
+                frm2_iter = imap_ordered(
+                    deflate_frm2, ((start_idx, bytes(frm2_data))
+                                   for start_idx, frm2_data in chunk_iter),
+                    workers)
+            else:
+                frm2_iter = ((start_idx, frm2_data, None)
+                             for start_idx, frm2_data in chunk_iter)
+
+            frm2_sink = Frm2ZipSink(zip_f, length)
+            with stats.timer('extract_frm2', size=length):
+                for start_idx, frm2_data, entry in frm2_iter:
+                    frm2_sink.write(start_idx, frm2_data, entry)
+                zip_f.close()
+            print('zip file saved at: ', dst_path)
+    if stats_path is not None:
+        stats.dump(stats_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+from utils.ddb_utils import open_ddb, read_pcm, snd_length, write_wav
+from utils.ddi_utils import load_ddi
+from utils.pool_utils import imap_ordered
+from utils.stats_utils import stats
+from utils.zip_utils import compression_types, deflate_wav, write_deflated
+import argparse
+import os
+import time
+import zipfile
+
+from typing import Iterator, Sequence
+
+
+def parse_args(args: Sequence[str] = None
+               ) -> tuple[str, str, str, str | None, int, str | None, bool,
+                          int, int]:
+    # initialize parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--src_path', required=True,
+                        help='source ddi or ddb file path, '
+                        'the other one is expected next to it')
+    parser.add_argument('--dst_path',
+                        help='destination extract path, '
+                        'default to be "./[name]/wav_renamed.zip"')
+    parser.add_argument('--cache_dir',
+                        help='parse cache directory of the ddi, '
+                        'see extract_ddi.py')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of threads reading (and compressing) '
+                        'the samples, default to be 1')
+    parser.add_argument('--compression', choices=compression_types.keys(),
+                        default='stored',
+                        help='compression of the zip entries, '
+                        'default to be stored')
+    parser.add_argument('--compress_level', type=int, default=6,
+                        help='deflate level from 0 to 9 '
+                        'when "compression" is deflate, default to be 6')
+    parser.add_argument('--stats',
+                        help='write wall time, bytes and records per stage '
+                        'and the peak memory to this json file')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print the progress of every sample')
+
+    # parse args
+    args_result = parser.parse_args(args)
+    src_path: str = os.path.normpath(args_result.src_path)
+    src_base, src_ext = os.path.splitext(src_path)
+    ddi_path = src_base+'.ddi'
+    ddb_path = src_base+'.ddb'
+    assert os.path.isfile(ddi_path) and os.path.isfile(ddb_path)
+
+    dst_path: str = args_result.dst_path
+    if dst_path is None:
+        src_dir, src_filename = os.path.split(src_base)
+        dst_path = os.path.join(src_dir, src_filename, 'wav_renamed.zip')
+    dst_path: str = os.path.normpath(dst_path)
+    assert dst_path.endswith('.zip')
+
+    # make dirs
+    dir_path = os.path.dirname(dst_path)
+    if dir_path and not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+    workers: int = args_result.workers
+    assert workers >= 1
+    compress_level: int = args_result.compress_level
+    assert 0 <= compress_level <= 9
+    return (ddi_path, ddb_path, dst_path, args_result.cache_dir, workers,
+            args_result.stats, args_result.quiet,
+            compression_types[args_result.compression], compress_level)
+
+
+def main(args: Sequence[str] = None):
+    (ddi_path, ddb_path, dst_path, cache_dir, workers,
+     stats_path, quiet, compression, compress_level) = parse_args(args)
+    stats.clear()
+    stats.quiet = quiet
+    with stats.timer('load_ddi', size=os.path.getsize(ddi_path)):
+        ddi = load_ddi(ddi_path, cache_dir)
+
+    with open_ddb(ddb_path) as ddb_data, open(ddb_path, 'rb') as ddb_f:
+        # The samples are read in ddi order, i.e. at random, through pread:
+        # pages faulted into the mapping would stay resident.
+        date_time = time.localtime(os.fstat(ddb_f.fileno()).st_mtime)[:6]
+        zip_f = zipfile.ZipFile(dst_path, 'w', compression=compression,
+                                compresslevel=compress_level)
+
+        def iter_sample() -> Iterator[tuple[str, int, int]]:
+            for part, part_dict in ddi.items():
+                for name, name_list in part_dict.items():
+                    for i, record in enumerate(name_list):
+                        name = name.replace('\\', '%5c')
+                        offset = record.snd_offset
+                        file_length = snd_length(ddb_data, offset,
+                                                 record.snd_identifier,
+                                                 ddb_f.fileno())
+                        if file_length == 0:
+                            print(f'    invalid snd index: {record.snd}'
+                                  f' for {part}/{name}_{i}')
+                            continue
+                        yield f'{part}/{name}_{i}', offset, file_length-18
+
+        def read_sample(sample: tuple[str, int, int]
+                        ) -> tuple[str, bytes, tuple | None]:
+            file_path, offset, pcm_length = sample
+            pcm_data = read_pcm(ddb_data, ddb_f.fileno(), offset, pcm_length)
+            entry = None
+            if workers > 1 and compression != zipfile.ZIP_STORED:
+                entry = deflate_wav(f'{file_path}.wav', pcm_data, date_time,
+                                    compress_level)
+            return file_path, pcm_data, entry
+
+        if workers > 1:
+            sample_iter = imap_ordered(read_sample, iter_sample(), workers)
+        else:
+            sample_iter = map(read_sample, iter_sample())
+        counter = 1
+        for file_path, pcm_data, entry in sample_iter:
+            stats.progress(f'{counter:5d}  {file_path}')
+            with stats.timer('write', size=len(pcm_data), records=1):
+                if entry is None:
+                    write_wav(zip_f, f'{file_path}.wav', pcm_data, date_time)
+                else:
+                    write_deflated(zip_f, *entry)
+            counter += 1
+        zip_f.close()
+    print('zip file saved at: ', dst_path)
+    if stats_path is not None:
+        stats.dump(stats_path)
+
+
+if __name__ == '__main__':
+    main()
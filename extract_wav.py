@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 
+from utils.ddb_utils import (iter_merge_wav, iter_snd, iter_snd_index,
+                             iter_snd_unreferenced, open_ddb, read_pcm,
+                             save_wav, wav_header_struct, wav_params)
+from utils.ddi_utils import load_ddi, snd_index
+from utils.pool_utils import imap_ordered
+from utils.scan_utils import WavZipSink
+from utils.stats_utils import stats
+from utils.zip_utils import ResumableZip, compression_types, deflate_wav
 import argparse
-import io
+import mmap
 import os
-import wave
+import time
 import zipfile
-from wave import Wave_write
 
-from typing import Sequence
-
-start_encode = 'SND '.encode()
-wav_params = (1, 2, 44100, 0, 'NONE', 'NONE')
+from typing import Iterable, Sequence
 
 
 def parse_args(args: Sequence[str] = None):  # : list[str]
@@ -20,98 +24,248 @@ def parse_args(args: Sequence[str] = None):  # : list[str]
                         help='source ddb file path')
     parser.add_argument('--dst_path',
                         help='destination extract path, '
-                        'default to be "./[name]/wav.zip (merge.wav)"')
+                        'default to be '
+                        '"./[name]/wav.zip (merge.wav, pcm.npy, wav)"')
     parser.add_argument('--merge', action='store_true',
                         help='enable to generate a merged large wav file')
     parser.add_argument('--silence_interval', type=float, default=0.0,
                         help='silence interval seconds '
                         'when "merge" is enabled, '
                         'default to be 0')
+    parser.add_argument('--loose', action='store_true',
+                        help='write a directory of wav files '
+                        'instead of wav.zip')
+    parser.add_argument('--npy', action='store_true',
+                        help='export all samples as one int16 pcm.npy '
+                        'and a pcm_index.npy next to it, needs numpy')
+    parser.add_argument('--ddi_path',
+                        help='source ddi file path (or its extracted ddi.yml, '
+                        'ddi.json or ddi.bin), '
+                        'used as the sample index instead of '
+                        'scanning the whole ddb')
+    parser.add_argument('--report_unreferenced', action='store_true',
+                        help='report samples not referenced by the ddi '
+                        'when "ddi_path" is given')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of threads reading (and compressing) '
+                        'the samples, default to be 1')
+    parser.add_argument('--compression', choices=compression_types.keys(),
+                        default='stored',
+                        help='compression of the zip entries, '
+                        'default to be stored')
+    parser.add_argument('--compress_level', type=int, default=6,
+                        help='deflate level from 0 to 9 '
+                        'when "compression" is deflate, default to be 6')
+    parser.add_argument('--restart', action='store_true',
+                        help='extract every sample again, instead of keeping '
+                        'the ones already in the zip according to its '
+                        'manifest')
+    parser.add_argument('--stats',
+                        help='write wall time, bytes and records per stage '
+                        'and the peak memory to this json file')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print the progress of every sample')
 
     # parse args
     args_result = parser.parse_args(args)
     src_path: str = os.path.normpath(args_result.src_path)
     dst_path: str = args_result.dst_path
     merge: bool = args_result.merge
+    npy: bool = args_result.npy
+    loose: bool = args_result.loose
+    assert merge+npy+loose <= 1
     silence_interval: float = args_result.silence_interval
     silence_bytes = int(wav_params[1]*wav_params[2]*silence_interval)
+    ddi_path: str = args_result.ddi_path
+    if ddi_path is not None:
+        ddi_path = os.path.normpath(ddi_path)
+        assert os.path.isfile(ddi_path)
 
     if dst_path is None:
         src_dir, src_filename = os.path.split(src_path)
         src_name, src_ext = os.path.splitext(src_filename)
         dst_filename = 'merge.wav' if merge else 'wav.zip'
+        dst_filename = 'pcm.npy' if npy else dst_filename
+        dst_filename = 'wav' if loose else dst_filename
         dst_path = os.path.join(src_dir, src_name, dst_filename)
     dst_path: str = os.path.normpath(dst_path)
-    assert dst_path.endswith('.wav') or dst_path.endswith('.zip')
+    if npy:
+        assert dst_path.endswith('.npy')
+    elif loose:
+        assert not os.path.isfile(dst_path)
+        os.makedirs(dst_path, exist_ok=True)
+    else:
+        assert dst_path.endswith('.wav') or dst_path.endswith('.zip')
 
     # make dirs
     dir_path = os.path.dirname(dst_path)
     if dir_path and not os.path.exists(dir_path):
         os.makedirs(dir_path)
 
-    return src_path, dst_path, merge, silence_bytes
+    workers: int = args_result.workers
+    assert workers >= 1
+    compression = compression_types[args_result.compression]
+    compress_level: int = args_result.compress_level
+    assert 0 <= compress_level <= 9
+
+    return (src_path, dst_path, merge, silence_bytes,
+            ddi_path, args_result.report_unreferenced, workers, npy,
+            args_result.stats, args_result.quiet, args_result.restart,
+            loose, compression, compress_level)
+
+
+def main(args: Sequence[str] = None):
+    (src_path, dst_path, merge, silence_bytes,
+     ddi_path, report_unreferenced, workers, npy,
+     stats_path, quiet, restart, loose,
+     compression, compress_level) = parse_args(args)
+    stats.clear()
+    stats.quiet = quiet
+    ddi_data_dict = None
+    snd_dict: dict[int, int] = None
+    if ddi_path is not None:
+        with stats.timer('load_ddi', size=os.path.getsize(ddi_path)):
+            ddi_data_dict = load_ddi(ddi_path)
+            snd_dict = snd_index(ddi_data_dict)
+        stats.add('load_ddi', records=len(snd_dict))
+    with open_ddb(src_path) as ddb_data, open(src_path, 'rb') as ddb_f:
+        if npy:
+            from utils.npy_utils import export_npy, snd_keys
+            index_path = dst_path[:-len('.npy')]+'_index.npy'
+            snd_iter = iter_snd(ddb_data) if snd_dict is None \
+                else iter_snd_index(ddb_data, snd_dict)
+            with stats.timer('export_npy', size=len(ddb_data)):
+                index = export_npy(ddb_data, dst_path, index_path, snd_iter,
+                                   None if ddi_data_dict is None
+                                   else snd_keys(ddi_data_dict))
+            stats.add('export_npy', records=len(index))
+            print(f'{len(index)} samples saved at: ', dst_path)
+            print('index saved at: ', index_path)
+        else:
+            # entries are stamped with the ddb mtime to keep the zip
+            # reproducible
+            date_time = time.localtime(os.fstat(ddb_f.fileno()).st_mtime)[:6]
+            with stats.timer('extract_wav', size=len(ddb_data)):
+                extract_wav(ddb_data, dst_path, merge, silence_bytes,
+                            snd_dict, workers=workers, ddb_fd=ddb_f.fileno(),
+                            date_time=date_time, resume=not restart,
+                            loose=loose, compression=compression,
+                            compress_level=compress_level)
+        if not npy and snd_dict is not None and report_unreferenced:
+            counter = 0
+            for start_idx, identifier, pcm_data in iter_snd_unreferenced(
+                    ddb_data, snd_dict):
+                counter += 1
+                print(f'unreferenced: {start_idx:016x}_{identifier:08x}')
+            print(f'{counter} unreferenced samples')
+    if stats_path is not None:
+        stats.dump(stats_path)
 
 
-def main():
-    src_path, dst_path, merge, silence_bytes = parse_args()
-    with open(src_path, 'rb') as ddb_f:
-        ddb_data = ddb_f.read()
+def extract_wav(ddb_data: mmap.mmap | bytes, dst_path: str,
+                merge: bool = False, silence_bytes: int = 0,
+                snd_dict: dict[int, int] = None, workers: int = 1,
+                ddb_fd: int = None,
+                date_time: tuple[int, int, int, int, int, int] = None,
+                resume: bool = True, loose: bool = False,
+                compression: int = zipfile.ZIP_STORED,
+                compress_level: int = None):
     length = len(ddb_data)
 
-    merge_f: Wave_write = None
-    zip_f: zipfile.ZipFile = None
+    if snd_dict is None:
+        snd_iter = iter_snd(ddb_data)
+    else:
+        snd_iter = iter_snd_index(ddb_data, snd_dict)
     if merge:
-        merge_f = wave.open(dst_path, 'wb')
-        merge_f.setparams(wav_params)
+        merge_wav(ddb_data, dst_path, snd_iter, silence_bytes, ddb_fd)
+        return
+    if loose:
+        loose_wav(ddb_data, dst_path, snd_iter, ddb_fd)
+        return
+
+    zip_f = ResumableZip(dst_path, resume=resume, compression=compression,
+                         compress_level=compress_level)
+
+    def read_snd(snd: tuple[int, int, int]
+                 ) -> tuple[int, int, bytes, tuple | None]:
+        # in a worker thread: the pcm data is read, and compressed unless
+        # the entry of the previous run is kept
+        start_idx, identifier, pcm_length = snd
+        pcm_data = read_pcm(ddb_data, ddb_fd, start_idx, pcm_length)
+        entry = None
+        file_path = f'wav/{start_idx:016x}_{identifier:08x}.wav'
+        if compression != zipfile.ZIP_STORED \
+                and not zip_f.matches(file_path, pcm_data):
+            entry = deflate_wav(file_path, pcm_data, date_time,
+                                compress_level)
+        return start_idx, identifier, pcm_data, entry
+
+    if workers > 1:
+        # chunk boundaries are collected first, then the samples are
+        # handed out by the thread pool in the original order
+        snd_list = [(start_idx, identifier, len(pcm_data))
+                    for start_idx, identifier, pcm_data in snd_iter]
+        snd_iter = imap_ordered(read_snd, snd_list, workers)
     else:
-        zip_f = zipfile.ZipFile(dst_path, 'w', compression=zipfile.ZIP_STORED)
+        snd_iter = ((start_idx, identifier, pcm_data, None)
+                    for start_idx, identifier, pcm_data in snd_iter)
+    wav_sink = WavZipSink(zip_f, length, date_time)
+    try:
+        for start_idx, identifier, pcm_data, entry in snd_iter:
+            wav_sink.write(start_idx, identifier, pcm_data, entry)
+    except BaseException:
+        # the samples written so far are kept for the next run
+        zip_f.abort()
+        raise
+    zip_f.close()
+    print('zip file saved at: ', dst_path)
 
-    counter = 0
-    offset = 0
-    while(True):
-        if (start_idx := ddb_data.find(start_encode, offset)) == -1:
-            break
-
-        file_length = int.from_bytes(ddb_data[start_idx+4:start_idx+8],
-                                     byteorder='little')
-        """
-        4 bytes of "SND "
-        4 bytes of size
-        4 bytes of frame rate
-        2 bytes of 01 00 (channel?)
-        4 bytes of unknown
-        [data]
-        """
-        offset = start_idx+file_length
-        if offset > length:
-            break
-        pcm_data = ddb_data[start_idx+18: offset]
-        identifier = int.from_bytes(ddb_data[start_idx+14:start_idx+18],
-                                    byteorder='little')
 
+def loose_wav(ddb_data: mmap.mmap | bytes, dst_dir: str,
+              snd_iter: Iterable[tuple[int, int, memoryview]],
+              ddb_fd: int = None) -> None:
+    # the same files as in wav.zip, but the pcm data never enters python
+    # where copy_file_range is available
+    snd_list = [(start_idx, identifier, len(pcm_data))
+                for start_idx, identifier, pcm_data in snd_iter]
+    counter = 0
+    for start_idx, identifier, pcm_length in snd_list:
         counter += 1
-        print(f'{counter:<10d} progress: {offset:0>8x} / {length:0>8x}')
+        stats.progress(f'{counter:<10d} progress: '
+                       f'{start_idx+18+pcm_length:0>8x} / '
+                       f'{len(ddb_data):0>8x}')
+        file_path = os.path.join(dst_dir,
+                                 f'{start_idx:016x}_{identifier:08x}.wav')
+        with stats.timer('write', size=pcm_length, records=1):
+            save_wav(ddb_data, ddb_fd, file_path, start_idx, pcm_length)
+        stats.progress('    wav saved at: ', file_path)
+    print('wav files saved at: ', dst_dir)
 
-        if merge:
-            merge_f.writeframes(pcm_data)
-            merge_f.writeframes(b'\x00'*silence_bytes)
-        else:
-            bytes_f = io.BytesIO()
-            # TODO: the filename should be reconsidered.
-            file_path = f'wav/{start_idx:016x}_{identifier:08x}.wav'
-            with wave.open(bytes_f, 'wb') as wav_f:
-                wav_f: Wave_write
-                wav_f.setparams(wav_params)
-                wav_f.writeframes(pcm_data)
-            zip_f.writestr(file_path, bytes_f.getvalue())
-            bytes_f.close()
-            print('    wav saved at: ', file_path)
-    if merge:
-        merge_f.close()
-        print('merged wav saved at: ', dst_path)
-    else:
-        zip_f.close()
-        print('zip file saved at: ', dst_path)
+
+def merge_wav(ddb_data: mmap.mmap | bytes, dst_path: str,
+              snd_iter: Iterable[tuple[int, int, memoryview]],
+              silence_bytes: int = 0, ddb_fd: int = None) -> None:
+    # one wav with a cue point per sample, and the same points as
+    # audacity labels in "[name].txt"
+    snd_list = [(start_idx, identifier, len(pcm_data))
+                for start_idx, identifier, pcm_data in snd_iter]
+    byte_rate = wav_params[0]*wav_params[1]*wav_params[2]
+    label_path = os.path.splitext(dst_path)[0]+'.txt'
+    with open(dst_path, 'wb', buffering=0) as merge_f, \
+            open(label_path, mode='w', encoding='utf-8') as label_f:
+        for counter, (start_idx, identifier, position) in enumerate(
+                iter_merge_wav(ddb_data, ddb_fd, merge_f, snd_list,
+                               silence_bytes), 1):
+            pcm_length = snd_list[counter-1][2]
+            stats.add('write', size=pcm_length, records=1)
+            stats.progress(f'{counter:<10d} progress: '
+                           f'{start_idx+18+pcm_length:0>8x} / '
+                           f'{len(ddb_data):0>8x}')
+            start = (position-wav_header_struct.size)/byte_rate
+            label_f.write(f'{start:.6f}\t{start+pcm_length/byte_rate:.6f}\t'
+                          f'{start_idx:016x}_{identifier:08x}\n')
+    print('merged wav saved at: ', dst_path)
+    print('labels saved at: ', label_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+from utils.archive_utils import DdiIndex
+import argparse
+import os
+
+from typing import Sequence
+
+
+def parse_args(args: Sequence[str] = None
+               ) -> tuple[str, list[str] | None, list[str], list[str],
+                          list[str], bool, str | None]:
+    # initialize parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--src_path', required=True,
+                        help='source ddi file path (or its extracted ddi.yml, '
+                        'ddi.json or ddi.bin)')
+    parser.add_argument('--part', nargs='+', choices=['sta', 'art', 'vqm'],
+                        help='parts of the ddi searched, '
+                        'default to be all of them')
+    parser.add_argument('--prefix', nargs='+', default=[],
+                        help='phonemes the keys start with')
+    parser.add_argument('--suffix', nargs='+', default=[],
+                        help='phonemes the keys end with')
+    parser.add_argument('--contains', nargs='+', default=[],
+                        help='phonemes found in a row in the keys')
+    parser.add_argument('--records', action='store_true',
+                        help='print the snd and epr number of every sample '
+                        'of the keys found')
+    parser.add_argument('--cache_dir',
+                        help='parse cache directory of the ddi, '
+                        'see extract_ddi.py')
+
+    # parse args
+    args_result = parser.parse_args(args)
+    src_path: str = os.path.normpath(args_result.src_path)
+    assert os.path.isfile(src_path)
+    return (src_path, args_result.part, args_result.prefix,
+            args_result.suffix, args_result.contains, args_result.records,
+            args_result.cache_dir)
+
+
+def main(args: Sequence[str] = None):
+    (src_path, parts, prefix, suffix, contains,
+     records, cache_dir) = parse_args(args)
+    ddi = DdiIndex.load(src_path, cache_dir)
+    counter = 0
+    for part in (parts or ddi.parts()):
+        if part not in ddi.parts():
+            continue
+        for key in ddi.find_keys(part, prefix, suffix, contains):
+            counter += 1
+            record_list = ddi.records(part, key)
+            print(f'{part}/{key}: {len(record_list)} samples')
+            if records:
+                for i, record in enumerate(record_list):
+                    print(f'    {i:<4d} {record.snd} '
+                          f'{len(record.epr)} epr')
+    print(f'{counter} keys found')
+
+
+if __name__ == '__main__':
+    main()
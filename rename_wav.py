@@ -1,49 +1,102 @@
 #!/usr/bin/env python3
 
+from utils.ddi_utils import artp_type, ddi_formats, load_ddi
+from utils.pool_utils import imap_ordered
+from utils.stats_utils import stats
+from utils.zip_utils import compression_types, deflate_entry, write_deflated
 import argparse
 import os
 import zipfile
-import yaml
 
-from typing import Sequence
+from typing import Iterator, Sequence
 
 
-def parse_args(args: Sequence[str] = None) -> str:
+def parse_args(args: Sequence[str] = None
+               ) -> tuple[str, str, str | None, bool, int, int, int]:
     # initialize parser
     parser = argparse.ArgumentParser()
     parser.add_argument('--work_dir', required=True,
                         help='working directory containing '
                         '"ddi.yml" and "wav.zip".')
+    parser.add_argument('--format', choices=ddi_formats.keys(), default='yaml',
+                        help='format of the ddi file written by '
+                        'extract_ddi.py (ddi.yml/ddi.json/ddi.bin), '
+                        'default to be yaml')
+    parser.add_argument('--compression', choices=compression_types.keys(),
+                        default='stored',
+                        help='compression of the zip entries, '
+                        'default to be stored')
+    parser.add_argument('--compress_level', type=int, default=6,
+                        help='deflate level from 0 to 9 '
+                        'when "compression" is deflate, default to be 6')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of threads compressing the entries, '
+                        'default to be 1')
+    parser.add_argument('--stats',
+                        help='write wall time, bytes and records per stage '
+                        'and the peak memory to this json file')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print the progress of every sample')
 
     # parse args
     args_result = parser.parse_args(args)
     work_dir: str = os.path.normpath(args_result.work_dir)
-    return work_dir
+    assert 0 <= args_result.compress_level <= 9
+    assert args_result.workers >= 1
+    return (work_dir, args_result.format,
+            args_result.stats, args_result.quiet,
+            compression_types[args_result.compression],
+            args_result.compress_level, args_result.workers)
 
 
-def main():
-    work_dir = parse_args()
-    ddi_yml_path = os.path.join(work_dir, 'ddi.yml')
+def main(args: Sequence[str] = None):
+    (work_dir, ddi_format, stats_path, quiet,
+     compression, compress_level, workers) = parse_args(args)
+    stats.clear()
+    stats.quiet = quiet
+    ddi_path = os.path.join(work_dir, ddi_formats[ddi_format])
     wav_zip_path = os.path.join(work_dir, 'wav.zip')
-    with open(ddi_yml_path, 'r') as yml_f:
-        ddi = yaml.load(yml_f, Loader=yaml.FullLoader)
-        ddi: dict[str, dict[str, list[dict[str, str | list[str]]]]]
+    ddi: dict[str, dict[str, list[artp_type]]]
+    with stats.timer('load_ddi', size=os.path.getsize(ddi_path)):
+        ddi = load_ddi(ddi_path)
     wav = zipfile.ZipFile(wav_zip_path, mode='r')
     wav_renamed = zipfile.ZipFile(os.path.join(work_dir, 'wav_renamed.zip'),
-                                  'w', compression=zipfile.ZIP_STORED)
+                                  'w', compression=compression,
+                                  compresslevel=compress_level)
+
+    def iter_wav() -> Iterator[tuple[str, bytes, tuple | None]]:
+        # wav.zip is read in order here, only the compression is pooled
+        for part, part_dict in ddi.items():
+            for name, name_list in part_dict.items():
+                for i, record in enumerate(name_list):
+                    name = name.replace('\\', '%5c')
+                    with stats.timer('read', records=1):
+                        wav_data = wav.read(f'wav/{record.snd}.wav')
+                    yield f'{part}/{name}_{i}.wav', wav_data, None
+
+    def deflate_sample(wav_entry: tuple[str, bytes, None]
+                       ) -> tuple[str, bytes, tuple]:
+        file_path, wav_data, entry = wav_entry
+        return file_path, wav_data, deflate_entry(
+            file_path, [wav_data], compress_level=compress_level)
+
+    wav_iter = iter_wav()
+    if compression != zipfile.ZIP_STORED and workers > 1:
+        wav_iter = imap_ordered(deflate_sample, wav_iter, workers)
     counter = 1
-    for part, part_dict in ddi.items():
-        for name, name_list in part_dict.items():
-            for i, name_dict in enumerate(name_list):
-                name = name.replace('\\', '%5c')
-                print(f'{counter:5d}  {part}/{name}_{i}')
-                fname: str = name_dict['snd']
-                wav_renamed.writestr(f'{part}/{name}_{i}.wav',
-                                     wav.read(f'wav/{fname}.wav'))
-                counter += 1
+    for file_path, wav_data, entry in wav_iter:
+        stats.progress(f'{counter:5d}  {file_path[:-len(".wav")]}')
+        with stats.timer('write', size=len(wav_data), records=1):
+            if entry is None:
+                wav_renamed.writestr(file_path, wav_data)
+            else:
+                write_deflated(wav_renamed, *entry)
+        counter += 1
 
     wav_renamed.close()
     wav.close()
+    if stats_path is not None:
+        stats.dump(stats_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+from bisect import bisect_left, bisect_right
+from utils.cache_utils import LRUCache
+from utils.ddb_utils import frm2_encode, open_ddb, snd_length, wav_header
+from utils.ddi_utils import artp_type, load_ddi, parse_snd, snd_index
+from utils.scan_utils import ChunkIndexSink, DdbScanner
+
+from contextlib import ExitStack
+from typing import Iterator, Sequence
+
+
+def phoneme_seq(phonemes: str | Sequence[str]) -> tuple[str, ...]:
+    # 'a b' or ['a', 'b'] -> ('a', 'b'), the keys of art join them by spaces
+    if isinstance(phonemes, str):
+        return tuple(phonemes.split(' ')) if phonemes else ()
+    return tuple(phonemes)
+
+
+class PhonemeIndex:
+    # The phoneme keys of one ddi part as sorted phoneme sequences. Prefix
+    # queries bisect the sequences, suffix queries their reversed copies,
+    # and contains queries start from the posting list of the rarest
+    # phoneme, so a lookup never scans every key.
+    def __init__(self, keys: list[str]):
+        self.seqs = sorted(phoneme_seq(key) for key in keys)
+        self.keys = [' '.join(seq) for seq in self.seqs]
+        rev_list = sorted((seq[::-1], i) for i, seq in enumerate(self.seqs))
+        self.rev_seqs = [rev_seq for rev_seq, i in rev_list]
+        self.rev_idx = [i for rev_seq, i in rev_list]
+        self.postings: dict[str, list[int]] = {}
+        for i, seq in enumerate(self.seqs):
+            for phoneme in dict.fromkeys(seq):
+                self.postings.setdefault(phoneme, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+    @staticmethod
+    def _range(seqs: list[tuple[str, ...]], prefix: tuple[str, ...]
+               ) -> tuple[int, int]:
+        n = len(prefix)
+        return (bisect_left(seqs, prefix, key=lambda seq: seq[:n]),
+                bisect_right(seqs, prefix, key=lambda seq: seq[:n]))
+
+    @staticmethod
+    def _match(seq: tuple[str, ...], prefix: tuple[str, ...],
+               suffix: tuple[str, ...], contains: tuple[str, ...]) -> bool:
+        if seq[:len(prefix)] != prefix:
+            return False
+        if suffix and seq[-len(suffix):] != suffix:
+            return False
+        n = len(contains)
+        return n == 0 or any(seq[j:j+n] == contains
+                             for j in range(len(seq)-n+1))
+
+    def find(self, prefix: str | Sequence[str] = (),
+             suffix: str | Sequence[str] = (),
+             contains: str | Sequence[str] = ()) -> list[str]:
+        # keys starting with prefix, ending with suffix and holding the
+        # contains sequence, all of the given ones, in sequence order
+        prefix, suffix = phoneme_seq(prefix), phoneme_seq(suffix)
+        contains = phoneme_seq(contains)
+        if prefix:
+            candidates = range(*self._range(self.seqs, prefix))
+        elif suffix:
+            lo, hi = self._range(self.rev_seqs, suffix[::-1])
+            candidates = sorted(self.rev_idx[lo:hi])
+        elif contains:
+            candidates = min((self.postings.get(phoneme, [])
+                              for phoneme in contains), key=len)
+        else:
+            candidates = range(len(self.seqs))
+        return [self.keys[i] for i in candidates
+                if self._match(self.seqs[i], prefix, suffix, contains)]
+
+    def prefix(self, phonemes: str | Sequence[str]) -> list[str]:
+        return self.find(prefix=phonemes)
+
+    def suffix(self, phonemes: str | Sequence[str]) -> list[str]:
+        return self.find(suffix=phonemes)
+
+    def contains(self, phonemes: str | Sequence[str]) -> list[str]:
+        return self.find(contains=phonemes)
+
+
+class DdiIndex:
+    # phoneme key and snd lookups over the records of load_ddi:
+    # {'sta'/'art'/'vqm': {phoneme key: [SndRecord, ...]}}
+    def __init__(self, ddi_data_dict: dict[str, dict[str, list[artp_type]]]):
+        self.ddi_data_dict = ddi_data_dict
+        self._snd_dict: dict[int, int] = None
+        self._identifier_dict: dict[int, int] = None
+        self._phoneme_dict: dict[str, PhonemeIndex] = {}
+
+    @classmethod
+    def load(cls, src_path: str, cache_dir: str = None) -> 'DdiIndex':
+        # raw .ddi or ddi.yml/json/bin, see load_ddi
+        return cls(load_ddi(src_path, cache_dir))
+
+    def parts(self) -> list[str]:
+        return list(self.ddi_data_dict.keys())
+
+    def keys(self, part: str) -> list[str]:
+        return list(self.ddi_data_dict.get(part, {}).keys())
+
+    def records(self, part: str, key: str) -> list[artp_type]:
+        return self.ddi_data_dict[part][key]
+
+    def phonemes(self, part: str) -> PhonemeIndex:
+        # built on first use for every part
+        if part not in self._phoneme_dict:
+            self._phoneme_dict[part] = PhonemeIndex(self.keys(part))
+        return self._phoneme_dict[part]
+
+    def find_keys(self, part: str, prefix: str | Sequence[str] = (),
+                  suffix: str | Sequence[str] = (),
+                  contains: str | Sequence[str] = ()) -> list[str]:
+        return self.phonemes(part).find(prefix, suffix, contains)
+
+    def snd_list(self, part: str, key: str) -> list[tuple[int, int]]:
+        return [(record.snd_offset, record.snd_identifier)
+                for record in self.records(part, key)]
+
+    @property
+    def snd_dict(self) -> dict[int, int]:
+        # SND chunk offset -> identifier, sorted by offset
+        if self._snd_dict is None:
+            self._snd_dict = snd_index(self.ddi_data_dict)
+        return self._snd_dict
+
+    def find_snd(self, identifier: int) -> tuple[int, int]:
+        if self._identifier_dict is None:
+            self._identifier_dict = {v: k for k, v in self.snd_dict.items()}
+        return self._identifier_dict[identifier], identifier
+
+
+class EprResolver:
+    # sorted FRM2 chunk offsets, every epr offset is resolved by bisection
+    # to the chunk containing it
+    def __init__(self, offsets: list[int], lengths: list[int]):
+        self.offsets = offsets
+        self.lengths = lengths
+
+    @classmethod
+    def scan(cls, ddb_data: mmap.mmap | bytes) -> 'EprResolver':
+        # one pass over the ddb, chunks come out in offset order
+        scanner = DdbScanner(ddb_data)
+        index_sink = ChunkIndexSink()
+        scanner.add_sink(frm2_encode, index_sink)
+        scanner.scan()
+        return cls(index_sink.offsets, index_sink.lengths)
+
+    @classmethod
+    def from_frames(cls, frames) -> 'EprResolver':
+        # frames as decoded by npy_utils.decode_frm2/load_frm2
+        order = frames['offset'].argsort(kind='stable')
+        return cls(frames['offset'][order].tolist(),
+                   frames['length'][order].tolist())
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def find(self, epr: str | int) -> int:
+        # frame index of the epr offset ('0>8x' string or int), -1 if none
+        offset = int(epr, 16) if isinstance(epr, str) else epr
+        i = bisect_right(self.offsets, offset)-1
+        if i < 0 or offset >= self.offsets[i]+self.lengths[i]:
+            return -1
+        return i
+
+    def resolve(self, epr_list: list[str | int]) -> list[int]:
+        return [self.find(epr) for epr in epr_list]
+
+
+class DdbArchive:
+    # Random access to the samples of a ddb. Opening only maps the file,
+    # the pcm data is paged in when a sample is actually read. The returned
+    # views point into the mapping, so release them before close().
+    # pcm() and wav() return copies kept in an LRU cache of cache_bytes.
+    def __init__(self, ddb_path: str,
+                 ddi: DdiIndex | dict[str, dict[str, list[artp_type]]]
+                 | str = None,
+                 cache_dir: str = None, cache_bytes: int = 64 << 20):
+        if ddi is None:
+            ddi_path = os.path.splitext(ddb_path)[0]+'.ddi'
+            ddi = ddi_path if os.path.isfile(ddi_path) else None
+        if isinstance(ddi, dict):
+            ddi = DdiIndex(ddi)
+        # a ddi path is only loaded by the first lookup that needs it
+        self._ddi: DdiIndex | None = None if isinstance(ddi, str) else ddi
+        self._ddi_path: str | None = ddi if isinstance(ddi, str) else None
+        self._cache_dir = cache_dir
+        self.ddb_path = ddb_path
+        self._exit_stack = ExitStack()
+        self.ddb_data: mmap.mmap | bytes = \
+            self._exit_stack.enter_context(open_ddb(ddb_path))
+        if isinstance(self.ddb_data, mmap.mmap) \
+                and hasattr(mmap, 'MADV_RANDOM'):
+            self.ddb_data.madvise(mmap.MADV_RANDOM)
+        self._ddb_view = self._exit_stack.enter_context(
+            memoryview(self.ddb_data))
+        self.cache = LRUCache(cache_bytes)
+        self._epr: EprResolver = None
+
+    @property
+    def ddi(self) -> DdiIndex | None:
+        if self._ddi_path is not None:
+            self._ddi = DdiIndex.load(self._ddi_path, self._cache_dir)
+            self._ddi_path = None
+        return self._ddi
+
+    def close(self) -> None:
+        self._exit_stack.close()
+
+    def __enter__(self) -> 'DdbArchive':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _snd(self, snd: str | tuple[int, int] | int) -> tuple[int, int]:
+        # snd is the ddi.yml "snd" string, an (offset, identifier) pair
+        # or a bare identifier looked up through the ddi
+        if isinstance(snd, str):
+            return parse_snd(snd)
+        if isinstance(snd, int):
+            assert self.ddi is not None, 'bare identifiers need a ddi'
+            return self.ddi.find_snd(snd)
+        return tuple(snd)
+
+    def sample(self, snd: str | tuple[int, int] | int) -> memoryview:
+        offset, identifier = self._snd(snd)
+        if (file_length := snd_length(self.ddb_data, offset,
+                                      identifier)) == 0:
+            raise KeyError('invalid snd index: '
+                           f'{offset:016x}_{identifier:08x}')
+        return self._ddb_view[offset+18:offset+file_length]
+
+    def pcm(self, snd: str | tuple[int, int] | int) -> bytes:
+        snd = self._snd(snd)
+
+        def load() -> bytes:
+            with self.sample(snd) as pcm_data:
+                return bytes(pcm_data)
+        return self.cache.get(('pcm', snd), load)
+
+    def wav(self, snd: str | tuple[int, int] | int) -> bytes:
+        # complete wav file, header included
+        snd = self._snd(snd)
+
+        def load() -> bytes:
+            with self.sample(snd) as pcm_data:
+                return wav_header(len(pcm_data))+pcm_data
+        return self.cache.get(('wav', snd), load)
+
+    @property
+    def epr(self) -> EprResolver:
+        # built on first use, one scan over the FRM2 chunks of the ddb
+        if self._epr is None:
+            self._epr = EprResolver.scan(self.ddb_data)
+        return self._epr
+
+    def frame(self, epr: str | int) -> memoryview:
+        # the whole FRM2 chunk containing the epr offset
+        if (i := self.epr.find(epr)) == -1:
+            raise KeyError(f'invalid epr offset: {epr}')
+        offset = self.epr.offsets[i]
+        return self._ddb_view[offset:offset+self.epr.lengths[i]]
+
+    def frames(self, part: str, key: str) -> list[list[memoryview]]:
+        # FRM2 chunks of every sample of the phoneme key, in epr order
+        assert self.ddi is not None, 'phoneme lookups need a ddi'
+        return [[self.frame(epr) for epr in record.epr]
+                for record in self.ddi.records(part, key)]
+
+    def samples(self, part: str, key: str) -> list[memoryview]:
+        assert self.ddi is not None, 'phoneme lookups need a ddi'
+        return [self.sample(snd) for snd in self.ddi.snd_list(part, key)]
+
+    def iter_samples(self, part: str = None
+                     ) -> Iterator[tuple[str, str, int, memoryview]]:
+        # (part, key, index, pcm) for every sample of the ddi, in ddi order
+        assert self.ddi is not None, 'phoneme lookups need a ddi'
+        for part_name in ([part] if part else self.ddi.parts()):
+            for key in self.ddi.keys(part_name):
+                for i, snd in enumerate(self.ddi.snd_list(part_name, key)):
+                    with self.sample(snd) as pcm_data:
+                        yield part_name, key, i, pcm_data
+
+    def sample_array(self, snd: str | tuple[int, int] | int):
+        # numpy int16 view of the same memory, numpy is only needed here
+        import numpy as np
+        return np.frombuffer(self.sample(snd), dtype='<i2')
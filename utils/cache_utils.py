@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+from collections import OrderedDict
+
+from typing import Callable, Hashable
+
+cache_version = 2
+cache_ext = '.pickle'
+
+
+def cache_path(cache_dir: str, key: str) -> str:
+    if not key.isalnum():
+        key = key.encode().hex()
+    return os.path.join(cache_dir, key+cache_ext)
+
+
+def load_cache(cache_dir: str, key: str, size: int, mtime: int):
+    # Every entry starts with a small (version, size, mtime) header, so a stale
+    # entry is detected and evicted without unpickling its payload.
+    path = cache_path(cache_dir, key)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'rb') as cache_f:
+            if pickle.load(cache_f) == (cache_version, size, mtime):
+                data = pickle.load(cache_f)
+                os.utime(path)
+                return data
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    os.remove(path)
+    return None
+
+
+def save_cache(cache_dir: str, key: str, size: int, mtime: int, data,
+               max_entries: int = 16) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, key)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as cache_f:
+        pickle.dump((cache_version, size, mtime), cache_f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(data, cache_f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    evict_cache(cache_dir, max_entries)
+
+
+def evict_cache(cache_dir: str, max_entries: int) -> None:
+    # least recently used entries go first, hits refresh the entry mtime
+    path_list = [os.path.join(cache_dir, filename)
+                 for filename in os.listdir(cache_dir)
+                 if filename.endswith(cache_ext)]
+    path_list.sort(key=os.path.getmtime, reverse=True)
+    for path in path_list[max_entries:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class LRUCache:
+    # in-memory bytes cache bounded by the total size of its values
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, load: Callable[[], bytes]) -> bytes:
+        if (value := self._data.get(key)) is not None:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = load()
+        self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: bytes) -> None:
+        if key in self._data:
+            self.size -= len(self._data.pop(key))
+        if len(value) > self.max_bytes:
+            return
+        self._data[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            self.size -= len(self._data.popitem(last=False)[1])
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._data), 'bytes': self.size}
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import re
+import struct
+import time
+import zipfile
+from contextlib import contextmanager
+
+from typing import Iterator
+
+snd_encode = 'SND '.encode()
+frm2_encode = 'FRM2'.encode()
+chunk_encodes = (snd_encode, frm2_encode)
+chunk_pattern = re.compile(b'|'.join(map(re.escape, chunk_encodes)))
+wav_params = (1, 2, 44100, 0, 'NONE', 'NONE')
+wav_header_struct = struct.Struct('<4sL4s4sLHHLLHH4sL')
+cue_point_struct = struct.Struct('<LL4sLLL')
+release_step = 64 << 20
+
+
+@contextmanager
+def open_ddb(src_path: str) -> Iterator[mmap.mmap | bytes]:
+    # map the ddb read-only so that only the touched pages are resident
+    with open(src_path, 'rb') as ddb_f:
+        if os.fstat(ddb_f.fileno()).st_size == 0:
+            yield b''
+            return
+        ddb_data = mmap.mmap(ddb_f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            ddb_data.madvise(mmap.MADV_SEQUENTIAL)
+        yield ddb_data
+    finally:
+        try:
+            ddb_data.close()
+        except BufferError:
+            # views still referenced by the traceback of an exception,
+            # the mapping goes away with them
+            pass
+
+
+class PageReleaser:
+    # Pages of the mapping behind a forward-moving cursor are dropped every
+    # release_step bytes, so the resident size does not grow with the bank
+    # size. Nothing is done for bytes or where madvise is not available.
+    def __init__(self, ddb_data: mmap.mmap | bytes, start: int = 0):
+        self.ddb_data = ddb_data
+        self.enabled = isinstance(ddb_data, mmap.mmap) \
+            and hasattr(mmap, 'MADV_DONTNEED')
+        self.released = start - start % mmap.PAGESIZE
+
+    def advance(self, offset: int) -> None:
+        # everything before offset is no longer needed
+        if self.enabled and offset-self.released > release_step:
+            release_end = offset - offset % mmap.PAGESIZE
+            self.ddb_data.madvise(mmap.MADV_DONTNEED, self.released,
+                                  release_end-self.released)
+            self.released = release_end
+
+
+def iter_chunks(ddb_data: mmap.mmap | bytes,
+                encodes: tuple[bytes, ...] = chunk_encodes,
+                start: int = 0, end: int = None
+                ) -> Iterator[tuple[bytes, int, memoryview]]:
+    # One walk over the chunk stream. A chunk of chunk_encodes is recognized
+    # by its header and skipped by its length, without reading its payload,
+    # the bytes between chunks are searched for the next header. Only the
+    # chunks of `encodes` are yielded, as (encode, offset, chunk view).
+    # The view is released once the consumer asks for the next chunk,
+    # so it must not be kept beyond the current iteration.
+    assert all(encode in chunk_encodes for encode in encodes)
+    end = len(ddb_data) if end is None else end
+    offset = start
+    releaser = PageReleaser(ddb_data, start)
+    with memoryview(ddb_data) as ddb_view:
+        while(True):
+            if offset+8 <= end \
+                    and (encode := ddb_data[offset:offset+4]) in chunk_encodes:
+                start_idx = offset
+            elif (match := chunk_pattern.search(ddb_data, offset, end)):
+                start_idx = match.start()
+                encode = match.group()
+            else:
+                break
+            releaser.advance(start_idx)
+            file_length = int.from_bytes(ddb_data[start_idx+4:start_idx+8],
+                                         byteorder='little')
+            if file_length < 8:
+                offset = start_idx+4
+                continue
+            offset = start_idx+file_length
+            if offset > end:
+                break
+            if encode not in encodes:
+                continue
+            chunk_data = ddb_view[start_idx:offset]
+            try:
+                yield encode, start_idx, chunk_data
+            finally:
+                chunk_data.release()
+
+
+def iter_chunk(ddb_data: mmap.mmap | bytes, start_encode: bytes,
+               start: int = 0, end: int = None
+               ) -> Iterator[tuple[int, memoryview]]:
+    # the chunks of one type, see iter_chunks
+    for encode, start_idx, chunk_data in iter_chunks(
+            ddb_data, (start_encode,), start, end):
+        yield start_idx, chunk_data
+
+
+def iter_snd(ddb_data: mmap.mmap | bytes, start: int = 0, end: int = None
+             ) -> Iterator[tuple[int, int, memoryview]]:
+    """
+    4 bytes of "SND "
+    4 bytes of size
+    4 bytes of frame rate
+    2 bytes of 01 00 (channel?)
+    4 bytes of unknown
+    [data]
+    """
+    for start_idx, chunk_data in iter_chunk(ddb_data, snd_encode, start, end):
+        identifier = int.from_bytes(chunk_data[14:18], byteorder='little')
+        with chunk_data[18:] as pcm_data:
+            yield start_idx, identifier, pcm_data
+
+
+def snd_length(ddb_data: mmap.mmap | bytes, start_idx: int,
+               identifier: int, ddb_fd: int = None) -> int:
+    # total chunk length of the indexed SND chunk, 0 if the index is wrong,
+    # the header is read through ddb_fd (see read_pcm) when it is given
+    if ddb_fd is not None and hasattr(os, 'pread'):
+        header = os.pread(ddb_fd, 18, start_idx)
+    else:
+        header = ddb_data[start_idx:start_idx+18]
+    if len(header) < 18 or header[:4] != snd_encode \
+            or int.from_bytes(header[14:18], byteorder='little') != identifier:
+        return 0
+    file_length = int.from_bytes(header[4:8], byteorder='little')
+    if file_length < 18 or start_idx+file_length > len(ddb_data):
+        return 0
+    return file_length
+
+
+def iter_snd_index(ddb_data: mmap.mmap | bytes, snd_dict: dict[int, int]
+                   ) -> Iterator[tuple[int, int, memoryview]]:
+    # same as iter_snd, but only visits the chunks listed in snd_dict,
+    # which is in offset order (see ddi_utils.snd_index)
+    releaser = PageReleaser(ddb_data)
+    with memoryview(ddb_data) as ddb_view:
+        for start_idx, identifier in snd_dict.items():
+            releaser.advance(start_idx)
+            if (file_length := snd_length(ddb_data, start_idx,
+                                          identifier)) == 0:
+                print(f'    invalid snd index: '
+                      f'{start_idx:016x}_{identifier:08x}')
+                continue
+            pcm_data = ddb_view[start_idx+18:start_idx+file_length]
+            try:
+                yield start_idx, identifier, pcm_data
+            finally:
+                pcm_data.release()
+
+
+def iter_snd_unreferenced(ddb_data: mmap.mmap | bytes,
+                          snd_dict: dict[int, int]
+                          ) -> Iterator[tuple[int, int, memoryview]]:
+    # SND chunks outside of the indexed ones, only the gaps are scanned
+    gap_start = 0
+    for start_idx, identifier in [*snd_dict.items(), (len(ddb_data), 0)]:
+        if start_idx > gap_start:
+            yield from iter_snd(ddb_data, gap_start, start_idx)
+        gap_start = max(gap_start,
+                        start_idx+snd_length(ddb_data, start_idx, identifier))
+
+
+def read_pcm(ddb_data: mmap.mmap | bytes, ddb_fd: int,
+             start_idx: int, pcm_length: int) -> bytes:
+    # os.pread releases the GIL while the pages are read in
+    if ddb_fd is not None and hasattr(os, 'pread'):
+        return os.pread(ddb_fd, pcm_length, start_idx+18)
+    return ddb_data[start_idx+18:start_idx+18+pcm_length]
+
+
+def wav_header(data_length: int, tail_length: int = 0) -> bytes:
+    # tail_length counts the chunks written after the data chunk
+    nchannels, sampwidth, framerate = wav_params[:3]
+    return wav_header_struct.pack(b'RIFF', 36+data_length+tail_length,
+                                  b'WAVE', b'fmt ',
+                                  16, 1, nchannels, framerate,
+                                  nchannels*framerate*sampwidth,
+                                  nchannels*sampwidth, sampwidth*8,
+                                  b'data', data_length)
+
+
+def set_compress_level(zinfo: zipfile.ZipInfo, compress_level: int | None
+                       ) -> None:
+    # ZipInfo._compresslevel is named compress_level from python 3.13
+    if hasattr(zinfo, 'compress_level'):
+        zinfo.compress_level = compress_level
+    else:
+        zinfo._compresslevel = compress_level
+
+
+def write_wav(zip_f: zipfile.ZipFile, file_path: str,
+              pcm_data: memoryview | bytes,
+              date_time: tuple[int, int, int, int, int, int] = None) -> None:
+    # same entry as zip_f.writestr, but the pcm data is streamed without copy
+    if date_time is None:
+        date_time = time.localtime(time.time())[:6]
+    zinfo = zipfile.ZipInfo(file_path, date_time=date_time)
+    zinfo.compress_type = zip_f.compression
+    set_compress_level(zinfo, zip_f.compresslevel)
+    zinfo.file_size = wav_header_struct.size+len(pcm_data)
+    with zip_f.open(zinfo, mode='w') as wav_f:
+        wav_f.write(wav_header(len(pcm_data)))
+        wav_f.write(pcm_data)
+
+
+def cue_chunks(cue_list: list[tuple[int, str]]) -> bytes:
+    # "cue " chunk and "LIST" "adtl" labels of (frame position, label)
+    cue_data = len(cue_list).to_bytes(4, byteorder='little')
+    adtl_data = b'adtl'
+    for i, (position, label) in enumerate(cue_list):
+        cue_data += cue_point_struct.pack(i+1, position, b'data', 0, 0,
+                                          position)
+        labl_data = (i+1).to_bytes(4, byteorder='little')
+        labl_data += label.encode()+b'\x00'
+        adtl_data += b'labl'+len(labl_data).to_bytes(4, byteorder='little')
+        adtl_data += labl_data+b'\x00'*(len(labl_data) % 2)
+    return (b'cue '+len(cue_data).to_bytes(4, byteorder='little')+cue_data
+            + b'LIST'+len(adtl_data).to_bytes(4, byteorder='little')
+            + adtl_data)
+
+
+def copy_pcm(ddb_data: mmap.mmap | bytes, ddb_fd: int, dst_f,
+             start_idx: int, pcm_length: int, dst_offset: int) -> None:
+    # copied file to file inside the kernel where copy_file_range works,
+    # written from the mapped view otherwise
+    src_offset = start_idx+18
+    if ddb_fd is not None and hasattr(os, 'copy_file_range'):
+        try:
+            while pcm_length > 0:
+                copied = os.copy_file_range(ddb_fd, dst_f.fileno(), pcm_length,
+                                            src_offset, dst_offset)
+                if copied == 0:
+                    break
+                src_offset += copied
+                dst_offset += copied
+                pcm_length -= copied
+        except OSError:
+            pass
+    if pcm_length > 0:
+        dst_f.seek(dst_offset)
+        with memoryview(ddb_data) as ddb_view, \
+                ddb_view[src_offset:src_offset+pcm_length] as pcm_data:
+            dst_f.write(pcm_data)
+
+
+def save_wav(ddb_data: mmap.mmap | bytes, ddb_fd: int, file_path: str,
+             start_idx: int, pcm_length: int) -> None:
+    # a standalone wav file, the pcm data is copied by copy_pcm
+    with open(file_path, 'wb', buffering=0) as wav_f:
+        wav_f.write(wav_header(pcm_length))
+        copy_pcm(ddb_data, ddb_fd, wav_f, start_idx, pcm_length,
+                 wav_header_struct.size)
+
+
+def iter_merge_wav(ddb_data: mmap.mmap | bytes, ddb_fd: int, dst_f,
+                   snd_list: list[tuple[int, int, int]], silence_bytes: int
+                   ) -> Iterator[tuple[int, int, int]]:
+    # Every sample is followed by silence_bytes of silence, which is never
+    # written: the output is preallocated with zeros up front. A cue point
+    # labelled like the wav.zip entries marks the start of every sample.
+    sampwidth = wav_params[1]
+    data_length = sum(snd[2]+silence_bytes for snd in snd_list)
+    cue_list: list[tuple[int, str]] = []
+    position = 0
+    for start_idx, identifier, pcm_length in snd_list:
+        cue_list.append((position//sampwidth,
+                         f'{start_idx:016x}_{identifier:08x}'))
+        position += pcm_length+silence_bytes
+    tail = b'\x00'*(data_length % 2)+cue_chunks(cue_list)
+
+    header_length = wav_header_struct.size
+    total_length = header_length+data_length+len(tail)
+    try:
+        os.posix_fallocate(dst_f.fileno(), 0, total_length)
+    except (AttributeError, OSError):
+        dst_f.truncate(total_length)
+    dst_f.seek(0)
+    dst_f.write(wav_header(data_length, len(tail)))
+    dst_f.seek(header_length+data_length)
+    dst_f.write(tail)
+
+    position = header_length
+    for start_idx, identifier, pcm_length in snd_list:
+        copy_pcm(ddb_data, ddb_fd, dst_f, start_idx, pcm_length, position)
+        yield start_idx, identifier, position
+        position += pcm_length+silence_bytes
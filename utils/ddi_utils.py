@@ -1,126 +1,612 @@
 #!/usr/bin/env python3
 
-import io
+from utils.cache_utils import load_cache, save_cache
+from utils.stats_utils import stats
+import gc
+import json
+import mmap
 import os
+import pickle
+import struct
+import sys
 import yaml
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 
-env = {'unknown': None, 'ddi_bytes': None}
+env = {'unknown': None}
 
-artp_type = dict[str, str | list[str]]
+# libyaml emits the same text as the pure python dumper, only faster
+yaml_dumper = getattr(yaml, 'CDumper', yaml.Dumper)
+yaml_loader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+ddi_formats = {'yaml': 'ddi.yml', 'json': 'ddi.json', 'bin': 'ddi.bin'}
+# ddi.bin starts with this version, like the entries of the parse cache
+ddi_bin_version = 1
+
+
+class SndRecord:
+    # One sample of a phoneme (STAp/ARTp/VQMp): its SND chunk and the epr
+    # offsets of its FRM2 chunks. Offsets stay ints and unknown fields raw
+    # bytes, the hex text of the yml files is only made when dumping.
+    __slots__ = ('snd_offset', 'snd_identifier', 'epr')
+
+    def __init__(self, snd_offset: int, snd_identifier: int, epr: array):
+        self.snd_offset = snd_offset
+        self.snd_identifier = snd_identifier
+        self.epr = epr
+
+    @property
+    def snd(self) -> str:
+        return f'{self.snd_offset:016x}_{self.snd_identifier:08x}'
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.snd})'
+
+    def __reduce__(self) -> tuple:
+        # pickled as the constructor arguments, far faster than the
+        # __slots__ state (see read_art_parallel)
+        return type(self), (self.snd_offset, self.snd_identifier, self.epr)
+
+    def ddi_dict(self) -> dict[str, str | list[str]]:
+        # the entry of ddi.yml/json/bin
+        return {'snd': self.snd,
+                'epr': [f'{epr_offset:0>8x}' for epr_offset in self.epr]}
+
+    def temp_dict(self) -> dict[str, str | list[str]]:
+        # the entry of sta.yml/art.yml/vqm.yml
+        return self.ddi_dict()
+
+    @classmethod
+    def from_dict(cls, record_dict: dict[str, str | list[str]]
+                  ) -> 'SndRecord':
+        return cls(*parse_snd(record_dict['snd']),
+                   array('Q', [int(epr, 16) for epr in record_dict['epr']]))
+
+
+class StapRecord(SndRecord):
+    __slots__ = ('snd_unknown', 'unknown1', 'unknown2')
+
+    def __init__(self, snd_offset: int, snd_identifier: int, epr: array,
+                 snd_unknown: int, unknown1: bytes, unknown2: bytes):
+        super().__init__(snd_offset, snd_identifier, epr)
+        self.snd_unknown = snd_unknown
+        self.unknown1 = unknown1
+        self.unknown2 = unknown2
+
+    def __reduce__(self) -> tuple:
+        return type(self), (self.snd_offset, self.snd_identifier, self.epr,
+                            self.snd_unknown, self.unknown1, self.unknown2)
+
+    def temp_dict(self) -> dict[str, str | list[str]]:
+        ddi_dict = self.ddi_dict()
+        return {'snd': ddi_dict['snd'],
+                'snd_unknown': f'{self.snd_unknown:08x}',
+                'epr': ddi_dict['epr'],
+                'unknown1': bytes_to_str(self.unknown1),
+                'unknown2': bytes_to_str(self.unknown2)}
+
+    @classmethod
+    def from_dict(cls, record_dict: dict[str, str | list[str]]
+                  ) -> 'StapRecord':
+        record = SndRecord.from_dict(record_dict)
+        return cls(record.snd_offset, record.snd_identifier, record.epr,
+                   int(record_dict['snd_unknown'], 16),
+                   bytes.fromhex(record_dict['unknown1']),
+                   bytes.fromhex(record_dict['unknown2']))
+
+
+class ArtpRecord(SndRecord):
+    __slots__ = ('snd_unknown', 'unknown0', 'unknown1', 'unknown2')
+
+    def __init__(self, snd_offset: int, snd_identifier: int, epr: array,
+                 snd_unknown: int, unknown0: bytes, unknown1: bytes,
+                 unknown2: bytes):
+        super().__init__(snd_offset, snd_identifier, epr)
+        self.snd_unknown = snd_unknown
+        self.unknown0 = unknown0
+        self.unknown1 = unknown1
+        self.unknown2 = unknown2
+
+    def __reduce__(self) -> tuple:
+        return type(self), (self.snd_offset, self.snd_identifier, self.epr,
+                            self.snd_unknown, self.unknown0, self.unknown1,
+                            self.unknown2)
+
+    def temp_dict(self) -> dict[str, str | list[str]]:
+        ddi_dict = self.ddi_dict()
+        return {'snd': ddi_dict['snd'],
+                'snd_unknown': f'{self.snd_unknown:08x}',
+                'epr': ddi_dict['epr'],
+                'unknown0': bytes_to_str(self.unknown0),
+                'unknown1': bytes_to_str(self.unknown1),
+                'unknown2': bytes_to_str(self.unknown2)}
+
+    @classmethod
+    def from_dict(cls, record_dict: dict[str, str | list[str]]
+                  ) -> 'ArtpRecord':
+        record = SndRecord.from_dict(record_dict)
+        return cls(record.snd_offset, record.snd_identifier, record.epr,
+                   int(record_dict['snd_unknown'], 16),
+                   bytes.fromhex(record_dict['unknown0']),
+                   bytes.fromhex(record_dict['unknown1']),
+                   bytes.fromhex(record_dict['unknown2']))
+
+
+class VqmpRecord(SndRecord):
+    __slots__ = ('unknown',)
+
+    def __init__(self, snd_offset: int, snd_identifier: int, epr: array,
+                 unknown: bytes):
+        super().__init__(snd_offset, snd_identifier, epr)
+        self.unknown = unknown
+
+    def __reduce__(self) -> tuple:
+        return type(self), (self.snd_offset, self.snd_identifier, self.epr,
+                            self.unknown)
+
+    def temp_dict(self) -> dict[str, str | list[str]]:
+        return {**self.ddi_dict(), 'unknown': bytes_to_str(self.unknown)}
+
+    @classmethod
+    def from_dict(cls, record_dict: dict[str, str | list[str]]
+                  ) -> 'VqmpRecord':
+        record = SndRecord.from_dict(record_dict)
+        return cls(record.snd_offset, record.snd_identifier, record.epr,
+                   bytes.fromhex(record_dict['unknown']))
+
+
+artp_type = SndRecord
+temp_record_cls: dict[str, type[SndRecord]] = {'stap': StapRecord,
+                                               'artp': ArtpRecord}
+
+
+class TempDumper(yaml_dumper):
+    # records are written as the dicts of sta.yml/art.yml/vqm.yml
+    pass
+
+
+TempDumper.add_multi_representer(
+    SndRecord,
+    lambda dumper, record: dumper.represent_dict(record.temp_dict()))
 artu_type = dict[str, str | dict[int, artp_type]]
 art_type = dict[str, str | dict[int, artu_type | dict]]
 
 
+class BufferReader:
+    # file-like cursor over a shared buffer (bytes or mmap), nothing is copied
+    # except the bytes actually read
+    def __init__(self, buffer: bytes | mmap.mmap, pos: int = 0):
+        self.buffer = buffer
+        self.pos = pos
+
+    def read(self, size: int = -1) -> bytes:
+        start = self.pos
+        if size < 0:
+            data = self.buffer[start:]
+        else:
+            data = self.buffer[start:start+size]
+        self.pos = start+len(data)
+        return data
+
+    def seek(self, pos: int) -> int:
+        self.pos = pos
+        return pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def find(self, sub: bytes) -> int:
+        return self.buffer.find(sub, self.pos)
+
+
+class Layout:
+    # Fixed-size record segment compiled into one struct.Struct.
+    # Each field is (name, format, expected):
+    #   name is None and expected is None: skipped (unchecked) bytes
+    #   expected is not None: magic value, checked together with the others
+    #   otherwise: decoded value returned by unpack
+    def __init__(self, name: str,
+                 fields: list[tuple[str | None, str, object]]):
+        self.name = name
+        self.fields: list[tuple[str, object]] = []
+        fmt = '<'
+        check_idx: list[int] = []
+        value_idx: list[int] = []
+        for field_name, field_fmt, expected in fields:
+            if field_name is None and expected is None:
+                fmt += f'{struct.calcsize(field_fmt)}x'
+                continue
+            if expected is None:
+                value_idx.append(len(self.fields))
+            else:
+                check_idx.append(len(self.fields))
+            self.fields.append((field_name, expected))
+            fmt += field_fmt
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.expected = tuple(self.fields[i][1] for i in check_idx)
+        self._check = _getter(check_idx)
+        self._values = _getter(value_idx)
+
+    def unpack(self, data: BufferReader) -> tuple:
+        pos = data.pos
+        values = self.struct.unpack_from(data.buffer, pos)
+        assert self._check(values) == self.expected, \
+            self._mismatch(values, pos)
+        data.pos = pos+self.size
+        return self._values(values)
+
+    def _mismatch(self, values: tuple, pos: int) -> str:
+        for (field_name, expected), value in zip(self.fields, values):
+            if expected is not None and value != expected:
+                return (f'{self.name} at {pos:0>8x}: '
+                        f'{field_name} == {value!r} != {expected!r}')
+        return self.name
+
+
+def _getter(idx: list[int]):
+    if len(idx) == 0:
+        return lambda values: ()
+    if len(idx) == 1:
+        return lambda values: (values[idx[0]],)
+    return itemgetter(*idx)
+
+
+sample_magic = b'\x44\xAC\x00\x00' + b'\x01\x00'   # 44100 Hz, mono
+float_magic = b'\x9A\x99\x19\x3F'
+tonio = None    # == 0 Exception: Tonio.ddi
+
+stau_layout = Layout('STAu', [
+    ('zero', 'Q', 0),
+    ('magic', '4s', b'STAu'),
+    (tonio, 'I', None),
+    ('one', 'I', 1),
+    ('zero', 'I', 0),
+    ('stau_idx', 'I', None),
+    ('ff', '8s', b'\xFF'*8),
+    ('stap_num', 'I', None),
+])
+stap_head_layout = Layout('STAp', [
+    ('zero', 'Q', 0),
+    ('magic', '4s', b'STAp'),
+    (tonio, 'I', None),
+    ('zero', 'I', 0),
+    ('one', 'I', 1),
+    ('unknown1', '18s', None),
+    (tonio, 'I', None),     # (0x19880)
+    ('float', '4s', float_magic),
+    (None, '4s', None),     # unknown
+    ('zero', 'I', 0),
+    ('two', 'I', 2),
+    ('size', 'Q', 0x3D),
+    ('empt', '4s', b'EMPT'),
+    (tonio, 'I', None),
+    ('snd_len', 'I', 3),
+    ('snd', '3s', b'SND'),
+    ('snd_unknown', 'I', None),
+    ('zero', 'I', 0),
+    ('empt', '4s', b'EMPT'),
+    (tonio, 'I', None),
+    ('epr_len', 'I', 3),
+    ('epr', '3s', b'EpR'),
+    (None, '4s', None),     # == b'\xFF'*4  Exception: Tonio.ddi (epr_num)
+    ('epr_num', 'I', None),
+])
+stap_tail_layout = Layout('STAp', [
+    ('sample', '6s', sample_magic),
+    ('snd_identifier', 'I', None),
+    ('snd_offset', 'Q', None),
+    ('unknown2', '13s', None),
+    ('magic', '4s', b'\x00\x00\x00\x01'),
+    ('stap_idx', '4s', None),
+])
+art_layout = Layout('ART ', [
+    (tonio, 'I', None),
+    ('one', 'I', 1),
+    ('zero', 'I', 0),
+    ('art_idx', 'I', None),
+    ('artu_num', 'I', None),
+])
+block_layout = Layout('block', [
+    ('zero', 'Q', 0),
+    ('block_type', '4s', None),
+])
+artu_layout = Layout('ARTu', [
+    (tonio, 'I', None),
+    ('zero', 'I', 0),
+    ('zero', 'I', 0),
+    ('artu_idx', 'I', None),
+    ('flag', 'Q', None),    # TODO: why to be 1?
+    ('ff', '8s', b'\xFF'*8),
+    ('artp_num', 'I', None),
+])
+artp_head_layout = Layout('ARTp', [
+    ('unknown0', '8s', None),
+    ('magic', '4s', b'ARTp'),
+    (tonio, 'I', None),
+    ('zero', 'I', 0),
+    ('one', 'I', 1),
+    ('unknown1', '18s', None),
+    ('float', '8s', b'\x00'*4+float_magic),
+    (None, '4s', None),     # unknown
+    ('two', 'I', 2),
+    ('artp_idx', 'Q', None),    # TODO: This doesn't seem to be an index
+    ('empt', '4s', b'EMPT'),
+    (tonio, 'I', None),
+    ('snd_len', 'I', 3),
+    ('snd', '3s', b'SND'),
+    ('snd_unknown', 'I', None),
+    ('zero', 'I', 0),
+    ('empt', '4s', b'EMPT'),
+    (tonio, 'I', None),
+    ('epr_len', 'I', 3),
+    ('epr', '3s', b'EpR'),
+])
+artp_tail_layout = Layout('ARTp', [
+    ('sample', '6s', sample_magic),
+    ('snd_identifier', 'I', None),
+    ('snd_offset', 'Q', None),
+    ('snd_end', 'Q', None),     # == snd_offset+0x800  Exception: Tonio.ddi (0)
+])
+vqmp_head_layout = Layout('VQMp', [
+    ('ff', '8s', b'\xFF'*8),
+    ('magic', '4s', b'VQMp'),
+    ('zero', 'I', 0),
+    ('zero', 'I', 0),
+    ('one', 'I', 1),
+    ('unknown', '18s', None),
+    ('float', '8s', b'\x00'*4+float_magic),
+    (None, '4s', None),     # TODO: that may not be same as env['unknown']
+    ('zero', 'I', 0),
+    ('ff', '4s', b'\xFF'*4),
+    ('epr_num', 'I', None),
+])
+vqmp_tail_layout = Layout('VQMp', [
+    ('sample', '6s', sample_magic),
+    ('snd_identifier', 'I', None),
+    ('snd_offset', 'Q', None),
+    ('ff', '16s', b'\xFF'*0x10),
+])
+uint32 = struct.Struct('<I')
+# section name, marker and the distance of the marker from the section start,
+# in file order
+section_markers = [
+    ('phdc', b'PHDC', 0),
+    ('tdb', b'\xFF'*8+b'TDB ', 0),
+    ('dbv', b'\x00'*8+b'DBV ', 0),
+    ('sta', b'\x00'*8+b'STA ', 0x14+8),
+    ('art', b'\x00'*8+b'ART ', 0x14+8),
+    ('vqm', b'\xFF'*8+b'VQM ', 0xC2),
+]
+art_heads = (b'\x00'*8, b'\xFF'*8)
+# the ddi mapped once by every process of read_art_parallel
+art_worker_data: mmap.mmap = None
+
+
 def bytes_to_str(data: bytes) -> str:
-    return ' '.join([f'{piece:02x}' for piece in list(data)])
+    return data.hex(' ')
+
+
+def read_str(data: BufferReader) -> str:
+    str_size, = uint32.unpack_from(data.buffer, data.pos)
+    start = data.pos+4
+    data.pos = start+str_size
+    return data.buffer[start:data.pos].decode()
 
 
-def read_str(data: io.BytesIO) -> str:
-    str_size = int.from_bytes(data.read(4), byteorder='little')
-    return data.read(str_size).decode()
+def read_epr(data: BufferReader, epr_num: int) -> array:
+    pos = data.pos
+    data.pos = pos+8*epr_num
+    epr_offsets = array('Q', data.buffer[pos:data.pos])
+    if sys.byteorder == 'big':
+        epr_offsets.byteswap()
+    return epr_offsets
 
 
-def read_arr(data: io.BytesIO) -> bytes:
+def read_arr(data: BufferReader) -> bytes:
     assert data.read(4).decode() == 'ARR '
     int.from_bytes(data.read(4), byteorder='little')    # == 0   Exception: Tonio.ddi
     assert int.from_bytes(data.read(8), byteorder='little') == 1
     return data.read(4)
 
+
+def read_toc(ddi_bytes: bytes | mmap.mmap) -> dict[str, tuple[int, int]]:
+    # Section name -> (offset, size), the size reaching to the next section.
+    # The sections are located in one walk: every marker is searched from
+    # the previous section on, or checked right at the end of the previous
+    # one where its header tells it (PHDC, DBV), so the file is scanned once
+    # and marker-like bytes in an earlier section are never taken.
+    offset_dict: dict[str, int] = {}
+    pos = 0
+    hint = None
+    for name, marker, marker_pos in section_markers:
+        marker_idx = -1 if hint is None else hint+marker_pos
+        if ddi_bytes[marker_idx:marker_idx+len(marker)] != marker:
+            marker_idx = ddi_bytes.find(marker, pos)
+        if marker_idx == -1:
+            continue
+        offset = marker_idx-marker_pos
+        offset_dict[name] = offset
+        pos = offset+marker_pos+len(marker)
+        hint = None
+        if name == 'phdc':
+            # PHDC and PHG2, then the hash string and its padding
+            phdc_size, = uint32.unpack_from(ddi_bytes, offset+4)
+            hint = offset+8+phdc_size+0x108
+        elif name == 'dbv':
+            hint = offset+0x1C
+    end_list = list(offset_dict.values())[1:]+[len(ddi_bytes)]
+    return {name: (offset, end-offset)
+            for (name, offset), end in zip(offset_dict.items(), end_list)}
+
 # ----------------------------------------- #
 
 
 def read_ddi(ddi_bytes: bytes, dst_path: str,
-             save_temp: bool = False, cat_only: bool = False):
+             save_temp: bool = False, cat_only: bool = False,
+             cache_dir: str = None, mtime: int = 0, ddi_format: str = 'yaml',
+             src_path: str = None, workers: int = 1
+             ) -> dict[str, dict[str, list[artp_type]]]:
     sta_data: dict[int, artu_type]
     art_data: dict[int, art_type]
     vqm_data: dict[int, artp_type]
     if cat_only:
         with open(os.path.join(dst_path, 'sta.yml'), mode='r',
                   encoding='utf-8') as sta_f:
-            sta_data = yaml.load(sta_f)
+            sta_data = from_temp(yaml.load(sta_f, Loader=yaml_loader))
         with open(os.path.join(dst_path, 'art.yml'), mode='r',
                   encoding='utf-8') as art_f:
-            art_data = yaml.load(art_f)
+            art_data = from_temp(yaml.load(art_f, Loader=yaml_loader))
         vqm_data = None
         if os.path.isfile(os.path.join(dst_path, 'vqm.yml')):
             with open(os.path.join(dst_path, 'vqm.yml'), mode='r',
                       encoding='utf-8') as vqm_f:
-                vqm_data = yaml.load(vqm_f)
+                vqm_data = from_temp(yaml.load(vqm_f, Loader=yaml_loader),
+                                     VqmpRecord)
     else:
-        env['ddi_bytes'] = ddi_bytes
-        ddi_data = io.BytesIO(ddi_bytes)
-        # DBSe
-        # Tonio.ddi has no DBSe block
-        
-        # assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0
-        # assert ddi_data.read(4).decode() == 'DBSe'
-        # assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-        # assert int.from_bytes(ddi_data.read(8), byteorder='little') == 1
-        # assert int.from_bytes(ddi_data.read(4), byteorder='little') == 3
-
-        # PHDC
-        phdc_offset = ddi_bytes.find(b'PHDC')
-        ddi_data.seek(phdc_offset)
-        phdc_data = read_phdc(ddi_data)
-        if save_temp:
-            with open(os.path.join(dst_path, 'phdc.yml'), mode='w',
-                      encoding='utf-8') as phdc_f:
-                phdc_str = yaml.dump(phdc_data, default_flow_style=False,
-                                     sort_keys=False)
-                phdc_f.write(phdc_str)
+        sta_data, art_data, vqm_data = parse_ddi(ddi_bytes, dst_path,
+                                                 save_temp=save_temp,
+                                                 cache_dir=cache_dir,
+                                                 mtime=mtime,
+                                                 src_path=src_path,
+                                                 workers=workers)
+    with stats.timer('convert_ddi'):
+        ddi_data_dict = convert_ddi(sta_data, art_data, vqm_data)
+    stats.add('convert_ddi', records=sum(
+        len(name_list) for part_dict in ddi_data_dict.values()
+        for name_list in part_dict.values()))
+    ddi_path = os.path.join(dst_path, ddi_formats[ddi_format])
+    with stats.timer('dump_ddi', records=1):
+        dump_ddi(ddi_data_dict, ddi_path)
+    stats.add('dump_ddi', size=os.path.getsize(ddi_path))
+    return ddi_data_dict
+
+
+def parse_ddi(ddi_bytes: bytes, dst_path: str = None, save_temp: bool = False,
+              cache_dir: str = None, mtime: int = 0, src_path: str = None,
+              workers: int = 1
+              ) -> tuple[dict[int, artu_type], dict[int, art_type],
+                         dict[int, artp_type] | None]:
+    ddi_data = BufferReader(ddi_bytes)
+    # DBSe
+    # Tonio.ddi has no DBSe block
+
+    # assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0
+    # assert ddi_data.read(4).decode() == 'DBSe'
+    # assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
+    # assert int.from_bytes(ddi_data.read(8), byteorder='little') == 1
+    # assert int.from_bytes(ddi_data.read(4), byteorder='little') == 3
+
+    with stats.timer('locate', size=len(ddi_bytes)):
+        toc = read_toc(ddi_bytes)
+    # PHDC and TDB only end up in the temp files and the cache
+    full = save_temp or cache_dir is not None
+    required = ['phdc', 'tdb', 'dbv', 'sta', 'art'] if full \
+        else ['dbv', 'sta', 'art']
+    if missing := [name for name in required if name not in toc]:
+        raise ValueError(f'{src_path or "ddi"} is truncated or malformed, '
+                         f'no {", ".join(missing)} section found')
 
+    # PHDC
+    phdc_data = None
+    if full:
+        phdc_offset = toc['phdc'][0]
+        with stats.timer('read_phdc'):
+            ddi_data.seek(phdc_offset)
+            phdc_data = read_phdc(ddi_data)
+        stats.add('read_phdc', size=ddi_data.tell()-phdc_offset)
+
+    # the remaining sections are cached by the PHDC hash
+    cache_data = None
+    if cache_dir is not None:
+        cache_data = load_cache(cache_dir, phdc_data['hash'],
+                                len(ddi_bytes), mtime)
+    if cache_data is not None:
+        tdb_data, sta_data, art_data, vqm_data = cache_data
+        stats.add('load_cache', records=1)
+    else:
         # TDB
-        tdb_offset = ddi_bytes.find(b'\xFF'*8+b'TDB ')
-        ddi_data.seek(tdb_offset)
-        tdb_data = read_tdb(ddi_data)
-        if save_temp:
-            with open(os.path.join(dst_path, 'tdb.yml'), mode='w',
-                    encoding='utf-8') as tdb_f:
-                tdb_str = yaml.dump(tdb_data, default_flow_style=False,
-                                    sort_keys=False)
-                tdb_f.write(tdb_str)
+        tdb_data = None
+        if full:
+            tdb_offset = toc['tdb'][0]
+            with stats.timer('read_tdb'):
+                ddi_data.seek(tdb_offset)
+                tdb_data = read_tdb(ddi_data)
+            stats.add('read_tdb', size=ddi_data.tell()-tdb_offset,
+                      records=len(tdb_data))
 
         # DBV
-        dbv_offset = ddi_bytes.find(b'\x00'*8+b'DBV ')
-        ddi_data.seek(dbv_offset)
+        ddi_data.seek(toc['dbv'][0])
         read_dbv(ddi_data)
 
         # STA
-        sta_offset = ddi_bytes.find(b'\x00'*8+b'STA ')-0x14-8
-        ddi_data.seek(sta_offset)
-        sta_data = read_sta(ddi_data)
-        if save_temp:
-            with open(os.path.join(dst_path, 'sta.yml'), mode='w',
-                      encoding='utf-8') as sta_f:
-                sta_str = yaml.dump(sta_data, default_flow_style=False,
-                                    sort_keys=False)
-                sta_f.write(sta_str)
+        sta_offset = toc['sta'][0]
+        with stats.timer('read_sta'):
+            ddi_data.seek(sta_offset)
+            sta_data = read_sta(ddi_data)
+        stats.add('read_sta', size=ddi_data.tell()-sta_offset,
+                  records=len(sta_data))
 
         # ART
-        art_offset = ddi_bytes.find(b'\x00'*8+b'ART ')-0x14-8
-        ddi_data.seek(art_offset)
-        art_data = read_art(ddi_data)
-        if save_temp:
-            with open(os.path.join(dst_path, 'art.yml'), mode='w',
-                      encoding='utf-8') as art_f:
-                art_str = yaml.dump(art_data, default_flow_style=False,
-                                    sort_keys=False)
-                art_f.write(art_str)
+        art_offset, art_size = toc['art']
+        with stats.timer('read_art'):
+            ddi_data.seek(art_offset)
+            # the pool processes map the file at src_path themselves
+            if workers > 1 and src_path is not None:
+                art_data = read_art_parallel(ddi_data, src_path,
+                                             art_offset+art_size, workers)
+            else:
+                art_data = read_art(ddi_data)
+        stats.add('read_art', size=ddi_data.tell()-art_offset,
+                  records=len(art_data))
 
         # VQM
-        vqm_offset = ddi_bytes.find(b'\xFF'*8+b'VQM ')
         vqm_data = None
-        if vqm_offset != -1:
-            vqm_offset -= 0xC2
-            ddi_data.seek(vqm_offset)
-            vqm_data = read_vqm(ddi_data)
-            if save_temp:
-                with open(os.path.join(dst_path, 'vqm.yml'), mode='w',
-                          encoding='utf-8') as vqm_f:
-                    vqm_str = yaml.dump(vqm_data, default_flow_style=False,
-                                        sort_keys=False)
-                    vqm_f.write(vqm_str)
-    # DDI convert
+        if 'vqm' in toc:
+            vqm_offset = toc['vqm'][0]
+            with stats.timer('read_vqm'):
+                ddi_data.seek(vqm_offset)
+                vqm_data = read_vqm(ddi_data)
+            stats.add('read_vqm', size=ddi_data.tell()-vqm_offset,
+                      records=len(vqm_data))
+
+        if cache_dir is not None:
+            with stats.timer('save_cache', records=1):
+                save_cache(cache_dir, phdc_data['hash'], len(ddi_bytes),
+                           mtime, (tdb_data, sta_data, art_data, vqm_data))
+
+    if save_temp:
+        temp_dict = {'phdc': phdc_data, 'tdb': tdb_data, 'sta': sta_data,
+                     'art': art_data, 'vqm': vqm_data}
+        for temp_name, temp_data in temp_dict.items():
+            if temp_data is None:
+                continue
+            temp_path = os.path.join(dst_path, f'{temp_name}.yml')
+            with stats.timer('dump_temp', records=1), \
+                    open(temp_path, mode='w', encoding='utf-8') as temp_f:
+                temp_str = yaml.dump(temp_data, default_flow_style=False,
+                                     sort_keys=False, Dumper=TempDumper)
+                temp_f.write(temp_str)
+            stats.add('dump_temp', size=os.path.getsize(temp_path))
+    return sta_data, art_data, vqm_data
+
+
+def from_temp(temp_data: dict, record_cls: type[SndRecord] = None) -> dict:
+    # records of the parse tree loaded from sta.yml/art.yml/vqm.yml, the
+    # record dicts are the values of the 'stap' and
+    # 'artp' dicts, or of the whole tree for vqm.yml
+    if record_cls is not None:
+        return {idx: record_cls.from_dict(record_dict)
+                for idx, record_dict in temp_data.items()}
+    return {key: from_temp(value, temp_record_cls.get(key))
+            if isinstance(value, dict) else value
+            for key, value in temp_data.items()}
+
+
+def convert_ddi(sta_data: dict[int, artu_type],
+                art_data: dict[int, art_type],
+                vqm_data: dict[int, artp_type] | None
+                ) -> dict[str, dict[str, list[artp_type]]]:
     ddi_data_dict: dict[str, dict[str, list[artp_type]]]
     ddi_data_dict = {
         'sta': {},
@@ -133,17 +619,11 @@ def read_ddi(ddi_bytes: bytes, dst_path: str,
             'sta': {},
             'art': {},
         }
-        vqm_dict = []
-        for idx, vqmp in vqm_data.items():
-            vqm_dict.append({'snd': vqmp['snd'], 'epr': vqmp['epr']})
-        ddi_data_dict['vqm'] = {'vqm': vqm_dict}
+        ddi_data_dict['vqm'] = {'vqm': list(vqm_data.values())}
 
     sta_dict: dict[str, list[artp_type]] = {}
     for stau in sta_data.values():
-        stau_dict: list[artp_type] = []
-        for idx, stap in stau['stap'].items():
-            stau_dict.append({'snd': stap['snd'], 'epr': stap['epr']})
-        sta_dict[stau['phoneme']] = stau_dict
+        sta_dict[stau['phoneme']] = list(stau['stap'].values())
     ddi_data_dict['sta'] = {key: sta_dict[key]
                             for key in sorted(sta_dict.keys())}
 
@@ -152,31 +632,107 @@ def read_ddi(ddi_bytes: bytes, dst_path: str,
         if 'artu' in art.keys():
             for artu in art['artu'].values():
                 key = art['phoneme']+' '+artu['phoneme']
-                art_dict[key] = []
-                for artp in artu['artp'].values():
-                    art_dict[key].append({'snd': artp['snd'],
-                                          'epr': artp['epr']})
+                art_dict[key] = list(artu['artp'].values())
         if 'art' in art.keys():
             for sub_art in art['art'].values():
                 sub_art: art_type
                 if 'artu' in sub_art.keys():
                     for artu in sub_art['artu'].values():
                         key = art['phoneme']+' '+sub_art['phoneme']+' '+artu['phoneme']
-                        art_dict[key] = []
-                        for artp in artu['artp'].values():
-                            art_dict[key].append({'snd': artp['snd'],
-                                                  'epr': artp['epr']})
+                        art_dict[key] = list(artu['artp'].values())
     ddi_data_dict['art'] = {key: art_dict[key]
                             for key in sorted(art_dict.keys())}
+    return ddi_data_dict
+
+
+class DdiBinUnpickler(pickle.Unpickler):
+    # ddi.bin holds only SndRecord and array objects, nothing else is loaded
+    def find_class(self, module: str, name: str):
+        if (module, name) == (SndRecord.__module__, 'SndRecord'):
+            return SndRecord
+        if module == 'array' and name in ('array', '_array_reconstructor'):
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f'{module}.{name} is not allowed in '
+                                     'ddi.bin')
+
+
+def dump_ddi(ddi_data_dict: dict[str, dict[str, list[artp_type]]],
+             ddi_path: str) -> None:
+    # format follows the extension, see ddi_formats
+    if ddi_path.endswith('.bin'):
+        # the records themselves, so that the epr offsets are not decoded
+        # again on every load
+        bin_dict = {part: {key: [SndRecord(record.snd_offset,
+                                           record.snd_identifier, record.epr)
+                                 for record in name_list]
+                           for key, name_list in part_dict.items()}
+                    for part, part_dict in ddi_data_dict.items()}
+        with open(ddi_path, mode='wb') as bin_f:
+            pickle.dump(ddi_bin_version, bin_f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(bin_dict, bin_f, protocol=pickle.HIGHEST_PROTOCOL)
+        return
+    ddi_data_dict = {part: {key: [record.ddi_dict() for record in name_list]
+                            for key, name_list in part_dict.items()}
+                     for part, part_dict in ddi_data_dict.items()}
+    if ddi_path.endswith('.json'):
+        with open(ddi_path, mode='w', encoding='utf-8') as json_f:
+            json.dump(ddi_data_dict, json_f, ensure_ascii=False,
+                      separators=(',', ':'))
+    else:
+        with open(ddi_path, mode='w', encoding='utf-8') as ddi_f:
+            ddi_str = yaml.dump(ddi_data_dict, default_flow_style=False,
+                                sort_keys=False, Dumper=yaml_dumper)
+            ddi_f.write(ddi_str)
+
+
+def load_ddi(src_path: str, cache_dir: str = None
+             ) -> dict[str, dict[str, list[artp_type]]]:
+    # accept either a raw .ddi or the ddi.yml/json/bin written by read_ddi
+    ddi_data_dict = None
+    if src_path.endswith('.yml'):
+        with open(src_path, mode='r', encoding='utf-8') as yml_f:
+            ddi_data_dict = yaml.load(yml_f, Loader=yaml_loader)
+    elif src_path.endswith('.json'):
+        with open(src_path, mode='r', encoding='utf-8') as json_f:
+            ddi_data_dict = json.load(json_f)
+    elif src_path.endswith('.bin'):
+        with open(src_path, mode='rb') as bin_f:
+            unpickler = DdiBinUnpickler(bin_f)
+            if unpickler.load() != ddi_bin_version:
+                raise ValueError(f'{src_path} was written by another version, '
+                                 'run extract_ddi.py again')
+            return unpickler.load()
+    if ddi_data_dict is not None:
+        return {part: {key: [SndRecord.from_dict(name_dict)
+                             for name_dict in name_list]
+                       for key, name_list in part_dict.items()}
+                for part, part_dict in ddi_data_dict.items()}
+    with open(src_path, 'rb') as ddi_f:
+        ddi_bytes = ddi_f.read()
+        mtime = os.fstat(ddi_f.fileno()).st_mtime_ns
+    return convert_ddi(*parse_ddi(ddi_bytes, cache_dir=cache_dir, mtime=mtime,
+                                  src_path=src_path))
+
+
+def parse_snd(snd: str) -> tuple[int, int]:
+    # '{offset:016x}_{identifier:08x}' -> (offset, identifier)
+    offset, identifier = snd.split('_')
+    return int(offset, 16), int(identifier, 16)
 
-    with open(os.path.join(dst_path, 'ddi.yml'), mode='w',
-              encoding='utf-8') as ddi_f:
-        ddi_str = yaml.dump(ddi_data_dict, default_flow_style=False,
-                            sort_keys=False)
-        ddi_f.write(ddi_str)
 
+def snd_index(ddi_data_dict: dict[str, dict[str, list[artp_type]]]
+              ) -> dict[int, int]:
+    # SND chunk offset -> identifier, sorted by offset
+    snd_dict: dict[int, int] = {}
+    for part_dict in ddi_data_dict.values():
+        for name_list in part_dict.values():
+            for record in name_list:
+                snd_dict[record.snd_offset] = record.snd_identifier
+    return {k: snd_dict[k] for k in sorted(snd_dict.keys())}
 
-def read_phdc(ddi_data: io.BytesIO):
+
+def read_phdc(ddi_data: BufferReader):
     phdc_data: dict[str, dict[int, list[str]]
                     | dict[str, dict[int, str]]
                     | dict[str, list[str]]
@@ -250,7 +806,7 @@ def read_phdc(ddi_data: io.BytesIO):
     return phdc_data
 
 
-def read_tdb(ddi_data: io.BytesIO) -> dict[int, str]:
+def read_tdb(ddi_data: BufferReader) -> dict[int, str]:
     tdb_data: dict[int, str] = {}
     assert ddi_data.read(8) == b'\xFF'*8
     assert ddi_data.read(4).decode() == 'TDB '
@@ -277,7 +833,7 @@ def read_tdb(ddi_data: io.BytesIO) -> dict[int, str]:
     return tdb_data
 
 
-def read_dbv(ddi_data: io.BytesIO) -> None:
+def read_dbv(ddi_data: BufferReader) -> None:
     assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0
     assert ddi_data.read(4).decode() == 'DBV '
     int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
@@ -285,7 +841,7 @@ def read_dbv(ddi_data: io.BytesIO) -> None:
     int.from_bytes(ddi_data.read(4), byteorder='little')    # 4 for AVANNA, 5 for others?
 
 
-def read_sta(ddi_data: io.BytesIO) -> dict[int, artu_type]:
+def read_sta(ddi_data: BufferReader) -> dict[int, artu_type]:
     sta_data: dict[int, artu_type] = {}
     assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0
     assert int.from_bytes(read_arr(ddi_data), byteorder='little') == 1
@@ -297,61 +853,16 @@ def read_sta(ddi_data: io.BytesIO) -> dict[int, artu_type]:
     stau_num = int.from_bytes(ddi_data.read(4), byteorder='little')
     for i in range(stau_num):
         stau_data: artu_type = {'phoneme': '', 'stap': {}}
-        assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0
-        assert ddi_data.read(4).decode() == 'STAu'
-        int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 1
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-        stau_idx = int.from_bytes(ddi_data.read(4), byteorder='little')
-        assert ddi_data.read(8) == b'\xFF'*8
-        stap_num = int.from_bytes(ddi_data.read(4), byteorder='little')
+        stau_idx, stap_num = stau_layout.unpack(ddi_data)
         for j in range(stap_num):
-            stap_data: artp_type = {'snd': '', 'snd_unknown': '', 'epr': []}
-            assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0
-            assert ddi_data.read(4).decode() == 'STAp'
-            int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 1
-            stap_data['unknown1'] = bytes_to_str(ddi_data.read(0x12))
-            int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi (0x19880)
-            assert ddi_data.read(4) == b'\x9A\x99\x19\x3F'
-            unknown = bytes_to_str(ddi_data.read(4))
-            # print(f'sta {i:4d} {j:4d} {unknown}')
-            # if env['unknown'] is None:
-            #     env['unknown'] = unknown
-            # else:
-            #     assert env['unknown'] == unknown
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 2
-            assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0x3D
-            assert ddi_data.read(4).decode() == 'EMPT'
-            int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-            assert read_str(ddi_data) == 'SND'
-            unknown_snd = int.from_bytes(ddi_data.read(4), byteorder='little')
-            stap_data['snd_unknown'] = f'{unknown_snd:08x}'
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-            assert ddi_data.read(4).decode() == 'EMPT'
-            int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-            assert read_str(ddi_data) == 'EpR'
-            ddi_data.read(4)  # == b'\xFF'*4  Exception: Tonio.ddi (epr_num)
-            epr_num = int.from_bytes(ddi_data.read(4), byteorder='little')
-            epr_list: list[str] = []
-            for k in range(epr_num):
-                epr_offset = int.from_bytes(ddi_data.read(8),
-                                            byteorder='little')
-                epr_list.append(f'{epr_offset:0>8x}')
-            stap_data['epr'] = epr_list
-            assert ddi_data.read(4) == b'\x44\xAC\x00\x00'
-            assert ddi_data.read(2) == b'\x01\x00'
-            snd_identifier = int.from_bytes(ddi_data.read(4),
-                                            byteorder='little')
+            unknown1, snd_unknown, epr_num = stap_head_layout.unpack(ddi_data)
+            epr_list = read_epr(ddi_data, epr_num)
+            (snd_identifier, snd_offset,
+             unknown2, stap_idx) = stap_tail_layout.unpack(ddi_data)
             # TODO: why this number?
-            snd_offset = int.from_bytes(ddi_data.read(8), byteorder='little')
-            stap_data['snd'] = f'{snd_offset-0x812:016x}_{snd_identifier:08x}'
-
-            stap_data['unknown2'] = bytes_to_str(ddi_data.read(0xD))
-            assert ddi_data.read(4) == b'\x00\x00\x00\x01'
-            stap_idx = int(ddi_data.read(4).decode().strip('\x00'))
+            stap_data = StapRecord(snd_offset-0x812, snd_identifier,
+                                   epr_list, snd_unknown, unknown1, unknown2)
+            stap_idx = int(stap_idx.decode().strip('\x00'))
             assert stap_idx not in stau_data['stap'].keys()
             stau_data['stap'][stap_idx] = stap_data
         stau_data['stap'] = {k: stau_data['stap'][k]
@@ -364,119 +875,154 @@ def read_sta(ddi_data: io.BytesIO) -> dict[int, artu_type]:
     return sta_data
 
 
-def read_art(ddi_data: io.BytesIO) -> dict[int, art_type]:
+def read_art(ddi_data: BufferReader,
+             block_dict: dict[int, tuple[int, int, art_type]] = None
+             ) -> dict[int, art_type]:
+    # block_dict: top-level blocks already parsed by read_art_range,
+    # block offset -> (block end, art_idx, art_data)
     total_art_data: dict[int, art_type] = {}
     int.from_bytes(ddi_data.read(8), byteorder='little')  # == 0 Exception: Tonio.ddi
     assert int.from_bytes(read_arr(ddi_data), byteorder='little') != 0
     while(True):
         start = ddi_data.read(8)
-        if not (start in [b'\x00'*8, b'\xFF'*8]):
+        if not (start in art_heads):
             offset = ddi_data.tell()-8
             ddi_data.seek(offset)
             assert read_str(ddi_data) == 'articulation'
             break
-        assert ddi_data.read(4).decode() == 'ART '
-        art_idx, art_data = read_art_block(ddi_data)
+        if block_dict is not None \
+                and (block := block_dict.get(ddi_data.tell()-8)) is not None:
+            block_end, art_idx, art_data = block
+            ddi_data.seek(block_end)
+        else:
+            assert ddi_data.read(4).decode() == 'ART '
+            art_idx, art_data = read_art_block(ddi_data)
         total_art_data[art_idx] = art_data
     total_art_data = {key: total_art_data[key]
                       for key in sorted(total_art_data.keys())}
     return total_art_data
 
 
-def read_art_block(ddi_data: io.BytesIO) -> tuple[int, art_type]:
+def read_art_parallel(ddi_data: BufferReader, src_path: str, end: int,
+                      workers: int) -> dict[int, art_type]:
+    # The same as read_art, with the top-level blocks parsed by a pool of
+    # processes over byte ranges of the section (up to end). The blocks
+    # carry no length, so their boundaries are only known once the chain
+    # from the first block is walked: every range is parsed speculatively
+    # by read_art_range, and read_art takes the blocks found on the chain,
+    # parsing any it misses itself.
+    start = ddi_data.tell()
+    range_num = workers*4
+    bound_list = [start+(end-start)*i//range_num
+                  for i in range(range_num+1)]
+    block_dict: dict[int, tuple[int, int, art_type]] = {}
+    # The parse tree holds no reference cycles, while the collections
+    # triggered by unpickling it walk the whole tree again and again.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_art_worker,
+                                 initargs=(src_path,)) as executor:
+            for block_list in executor.map(read_art_range, bound_list[:-1],
+                                           bound_list[1:]):
+                for block_start, block_end, art_idx, art_data in block_list:
+                    block_dict[block_start] = block_end, art_idx, art_data
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return read_art(ddi_data, block_dict)
+
+
+def init_art_worker(src_path: str) -> None:
+    # a pool process only builds parse trees, see read_art_parallel
+    global art_worker_data
+    gc.disable()
+    with open(src_path, 'rb') as ddi_f:
+        art_worker_data = mmap.mmap(ddi_f.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+
+
+def find_art_head(buffer: bytes | mmap.mmap, start: int, end: int) -> int:
+    # first header in [start, end) that may be a top-level ART block, -1 if
+    # none, nested blocks (b'\x00'*8) look the same
+    while (marker_idx := buffer.find(b'ART ', start+8, end+8)) != -1:
+        if buffer[marker_idx-8:marker_idx] in art_heads:
+            return marker_idx-8
+        start = marker_idx-7
+    return -1
+
+
+def read_art_range(start: int, end: int
+                   ) -> list[tuple[int, int, int, art_type]]:
+    # In a pool process of read_art_parallel: the chain of top-level blocks
+    # from the first header at or after start, up to the block ending at or
+    # after end, as (block offset, block end, art_idx, art_data). A chain
+    # from a nested block fails or stops on an ARTu block, then the next
+    # header is tried.
+    buffer = art_worker_data
+    ddi_data = BufferReader(buffer)
+    block_list: list[tuple[int, int, int, art_type]] = []
+    head = find_art_head(buffer, start, end)
+    while head != -1:
+        ddi_data.seek(head)
+        block_num = len(block_list)
+        try:
+            while ddi_data.pos < end \
+                    and buffer[ddi_data.pos:ddi_data.pos+8] in art_heads \
+                    and buffer[ddi_data.pos+8:ddi_data.pos+12] == b'ART ':
+                block_start = ddi_data.pos
+                ddi_data.pos += 12
+                art_idx, art_data = read_art_block(ddi_data)
+                block_list.append((block_start, ddi_data.pos,
+                                   art_idx, art_data))
+            if ddi_data.pos >= end or read_str(ddi_data) == 'articulation':
+                break
+        except Exception:
+            pass
+        del block_list[block_num:]
+        head = find_art_head(buffer, head+1, end)
+    return block_list
+
+
+def read_art_block(ddi_data: BufferReader) -> tuple[int, art_type]:
     art_data: art_type = {'phoneme': '', 'artu': {}, 'art': {}}
-    int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-    assert int.from_bytes(ddi_data.read(4), byteorder='little') == 1
-    assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-    art_idx = int.from_bytes(ddi_data.read(4), byteorder='little')
-    artu_num = int.from_bytes(ddi_data.read(4), byteorder='little')
+    art_idx, artu_num = art_layout.unpack(ddi_data)
     i = -1
     for i in range(artu_num):
         artu_data: artu_type = {'phoneme': '', 'artp': {}}
-        assert int.from_bytes(ddi_data.read(8), byteorder='little') == 0
-        block_type = ddi_data.read(4).decode()
-        if block_type == 'ART ':
+        block_type, = block_layout.unpack(ddi_data)
+        if block_type == b'ART ':
             sub_art_idx, sub_art_data = read_art_block(ddi_data)
             art_data['art'][sub_art_idx] = sub_art_data
             continue
         else:
-            assert block_type == 'ARTu'
-        int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-        artu_idx = int.from_bytes(ddi_data.read(4), byteorder='little')
-        # TODO: why to be 1?
-        assert int.from_bytes(ddi_data.read(8),
-                              byteorder='little') in [0, 1]
-        assert ddi_data.read(8) == b'\xFF'*8
-        artp_num = int.from_bytes(ddi_data.read(4), byteorder='little')
+            assert block_type == b'ARTu'
+        artu_idx, artu_flag, artp_num = artu_layout.unpack(ddi_data)
+        assert artu_flag in [0, 1]
         for j in range(artp_num):
-            artp_data: artp_type = {'snd': '', 'snd_unknown': '', 'epr': []}
-            artp_data['unknown0'] = bytes_to_str(ddi_data.read(8))
-            assert ddi_data.read(4).decode() == 'ARTp'
-            int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 1
-            artp_data['unknown1'] = bytes_to_str(ddi_data.read(0x12))
-            assert ddi_data.read(8) == b'\x00\x00\x00\x00\x9A\x99\x19\x3F'
-            unknown = bytes_to_str(ddi_data.read(4))
-            # print(f'art {i:4d} {j:4d} {unknown}')
-            # if env['unknown'] is None:
-            #     env['unknown'] = unknown
-            # else:
-            #     assert env['unknown'] == unknown
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 2
-            # TODO: This doesn't seem to be an index actually
-            artp_idx = int.from_bytes(ddi_data.read(8), byteorder='little')
-            assert ddi_data.read(4).decode() == 'EMPT'
-            int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-            assert read_str(ddi_data) == 'SND'
-            unknown_snd = int.from_bytes(ddi_data.read(4), byteorder='little')
-            artp_data['snd_unknown'] = f'{unknown_snd:08x}'
-            assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-            assert ddi_data.read(4).decode() == 'EMPT'
-            int.from_bytes(ddi_data.read(4), byteorder='little')  # == 0 Exception: Tonio.ddi
-            assert read_str(ddi_data) == 'EpR'
-            loc = ddi_data.tell()
-            try:
-                epr_num = int.from_bytes(ddi_data.read(4), byteorder='little')
-                epr_list: list[str] = []
-                for k in range(epr_num):
-                    epr_offset = int.from_bytes(ddi_data.read(8),
-                                                byteorder='little')
-                    epr_list.append(f'{epr_offset:0>8x}')
-                artp_data['epr'] = epr_list
-                assert ddi_data.read(4) == b'\x44\xAC\x00\x00'
-                assert ddi_data.read(2) == b'\x01\x00'
-            except AssertionError:
-                ddi_data.seek(loc)
-                ddi_data.read(4)  # == b'\xFF'*4  Exception: Tonio.ddi (epr_num)
-                epr_num = int.from_bytes(ddi_data.read(4), byteorder='little')
-                epr_list: list[str] = []
-                for k in range(epr_num):
-                    epr_offset = int.from_bytes(ddi_data.read(8),
-                                                byteorder='little')
-                    epr_list.append(f'{epr_offset:0>8x}')
-                artp_data['epr'] = epr_list
-                assert ddi_data.read(4) == b'\x44\xAC\x00\x00'
-                assert ddi_data.read(2) == b'\x01\x00'
-                
-            snd_identifier = int.from_bytes(ddi_data.read(4),
-                                            byteorder='little')
-            # TODO: why this number?
-            snd_offset = int.from_bytes(ddi_data.read(8), byteorder='little')
-            artp_data['snd'] = f'{snd_offset-0x12:016x}_{snd_identifier:08x}'
-            assert int.from_bytes(ddi_data.read(8),
-                                  byteorder='little'
-                                  )  # == snd_offset+0x800  Exception: Tonio.ddi (0)
-
-            ddi_bytes: bytes = env['ddi_bytes'][ddi_data.tell():]
-            unknown2_length = ddi_bytes.find(b'default')-4
-            artp_data['unknown2'] = bytes_to_str(ddi_data.read(
-                unknown2_length))
-            # print(f'{unknown2_length:x}')
+            (unknown0, unknown1, artp_idx,
+             snd_unknown) = artp_head_layout.unpack(ddi_data)
+            loc = ddi_data.pos
+            epr_num, = uint32.unpack_from(ddi_data.buffer, loc)
+            end = loc+4+8*epr_num
+            if ddi_data.buffer[end:end+6] != sample_magic:
+                # Exception: Tonio.ddi (epr_num)
+                loc += 4
+                epr_num, = uint32.unpack_from(ddi_data.buffer, loc)
+            ddi_data.pos = loc+4
+            epr_list = read_epr(ddi_data, epr_num)
+            (snd_identifier, snd_offset,
+             snd_end) = artp_tail_layout.unpack(ddi_data)
+            assert snd_end
+
+            unknown2_length = ddi_data.find(b'default')-4-ddi_data.pos
+            unknown2 = ddi_data.read(unknown2_length)
             assert read_str(ddi_data) == 'default'
 
+            # TODO: why this number?
+            artp_data = ArtpRecord(snd_offset-0x12, snd_identifier, epr_list,
+                                   snd_unknown, unknown0, unknown1, unknown2)
             assert artp_idx not in artu_data['artp'].keys()
             artu_data['artp'][artp_idx] = artp_data
         artu_data['artp'] = {k: artu_data['artp'][k]
@@ -495,7 +1041,7 @@ def read_art_block(ddi_data: io.BytesIO) -> tuple[int, art_type]:
     return art_idx, art_data
 
 
-def read_vqm(ddi_data: io.BytesIO) -> dict[int, artp_type]:
+def read_vqm(ddi_data: BufferReader) -> dict[int, artp_type]:
     vqm_data: dict[int, artp_type] = {}
     assert ddi_data.read(8) == b'\xFF'*8
     assert int.from_bytes(read_arr(ddi_data), byteorder='little') == 3
@@ -529,30 +1075,10 @@ def read_vqm(ddi_data: io.BytesIO) -> dict[int, artp_type]:
     vqmp_num = int.from_bytes(ddi_data.read(4), byteorder='little')
     assert int.from_bytes(ddi_data.read(4), byteorder='little') == vqmp_num
     for i in range(vqmp_num):
-        vqmp_data = {'snd': '', 'epr': []}
-        assert ddi_data.read(8) == b'\xFF'*8
-        assert ddi_data.read(4).decode() == 'VQMp'
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 1
-        vqmp_data['unknown'] = bytes_to_str(ddi_data.read(0x12))
-        assert ddi_data.read(8) == b'\x00\x00\x00\x00\x9A\x99\x19\x3F'
-        # TODO: that may not be same as env['unknown']
-        bytes_to_str(ddi_data.read(4))
-        assert int.from_bytes(ddi_data.read(4), byteorder='little') == 0
-        assert ddi_data.read(4) == b'\xFF'*4
-        epr_num = int.from_bytes(ddi_data.read(4), byteorder='little')
-        epr_list: list[str] = []
-        for k in range(epr_num):
-            epr_offset = int.from_bytes(ddi_data.read(8), byteorder='little')
-            epr_list.append(f'{epr_offset:0>8x}')
-        vqmp_data['epr'] = epr_list
-        assert ddi_data.read(4) == b'\x44\xAC\x00\x00'
-        assert ddi_data.read(2) == b'\x01\x00'
-        snd_identifier = int.from_bytes(ddi_data.read(4), byteorder='little')
-        snd_offset = int.from_bytes(ddi_data.read(8), byteorder='little')
-        vqmp_data['snd'] = f'{snd_offset:016x}_{snd_identifier:08x}'
-        assert ddi_data.read(0x10) == b'\xFF'*0x10
+        unknown, epr_num = vqmp_head_layout.unpack(ddi_data)
+        epr_list = read_epr(ddi_data, epr_num)
+        snd_identifier, snd_offset = vqmp_tail_layout.unpack(ddi_data)
+        vqmp_data = VqmpRecord(snd_offset, snd_identifier, epr_list, unknown)
         vqmp_idx = int(read_str(ddi_data))
         vqm_data[vqmp_idx] = vqmp_data
     assert read_str(ddi_data) == 'GROWL'
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import mmap
+import numpy as np
+from numpy.lib import format as npy_format
+from utils.ddb_utils import PageReleaser, release_step, wav_params
+from utils.ddi_utils import artp_type
+
+from typing import Iterable
+
+pcm_dtype = np.dtype(f'<i{wav_params[1]}')
+frm2_header_dtype = np.dtype([('magic', 'S4'), ('length', '<u4')])
+# frames per header gather, and payload bytes per payload gather, whose
+# int64 index takes 8 times as much
+frm2_batch = 1 << 16
+frm2_batch_bytes = 2 << 20
+
+
+def index_dtype(key_length: int) -> np.dtype:
+    # start and length are counted in samples of the pcm array
+    return np.dtype([('offset', '<u8'), ('identifier', '<u4'),
+                     ('start', '<u8'), ('length', '<u8'),
+                     ('key', f'<U{max(key_length, 1)}')])
+
+
+def snd_keys(ddi_data_dict: dict[str, dict[str, list[artp_type]]]
+             ) -> dict[int, str]:
+    # SND chunk offset -> "part/name_i" of its first reference in the ddi
+    key_dict: dict[int, str] = {}
+    for part, part_dict in ddi_data_dict.items():
+        for name, name_list in part_dict.items():
+            for i, record in enumerate(name_list):
+                key_dict.setdefault(record.snd_offset, f'{part}/{name}_{i}')
+    return key_dict
+
+
+def export_npy(ddb_data: mmap.mmap | bytes, dst_path: str, index_path: str,
+               snd_iter: Iterable[tuple[int, int, memoryview]],
+               key_dict: dict[int, str] = None) -> np.ndarray:
+    # The chunk boundaries are collected first, so that the header of the
+    # pcm array is known, then the pcm data is streamed straight from the
+    # ddb into the .npy file, which can be opened with mmap_mode='r'.
+    key_dict = {} if key_dict is None else key_dict
+    snd_list = [(start_idx, identifier, len(pcm_data)//pcm_dtype.itemsize)
+                for start_idx, identifier, pcm_data in snd_iter]
+    key_length = max((len(key) for key in key_dict.values()), default=0)
+    index = np.zeros(len(snd_list), dtype=index_dtype(key_length))
+
+    total_length = sum(snd[2] for snd in snd_list)
+    with open(dst_path, 'wb') as npy_f, memoryview(ddb_data) as ddb_view:
+        npy_format.write_array_header_2_0(npy_f, {
+            'descr': npy_format.dtype_to_descr(pcm_dtype),
+            'fortran_order': False,
+            'shape': (total_length,),
+        })
+        start = 0
+        releaser = PageReleaser(ddb_data)
+        for i, (start_idx, identifier, pcm_length) in enumerate(snd_list):
+            releaser.advance(start_idx)
+            index[i] = (start_idx, identifier, start, pcm_length,
+                        key_dict.get(start_idx, ''))
+            pcm_start = start_idx+18
+            with ddb_view[pcm_start:pcm_start
+                          + pcm_length*pcm_dtype.itemsize] as pcm_data:
+                npy_f.write(pcm_data)
+            start += pcm_length
+    np.save(index_path, index)
+    return index
+
+
+def frm2_dtype() -> np.dtype:
+    # start and count index the flat payload array, in payload items, rest
+    # is the number of trailing payload bytes short of one item
+    return np.dtype([('offset', '<u8'), ('length', '<u4'),
+                     ('start', '<u8'), ('count', '<u4'), ('rest', '<u1')])
+
+
+def decode_frm2(ddb_data: mmap.mmap | bytes, offsets: Iterable[int],
+                payload_dtype: str = '<f4') -> tuple[np.ndarray, np.ndarray]:
+    # Only the 8 bytes header of a FRM2 chunk is known, the payload is
+    # decoded as a flat array of payload_dtype items. The bytes of a payload
+    # that is not a whole number of items are counted in 'rest' and left
+    # out. Every batch of frames is gathered with a single fancy index over
+    # the mapped ddb, releasing the pages behind. A batch spans at most
+    # release_step bytes of the ddb, the offsets being in ddb order.
+    payload_dtype = np.dtype(payload_dtype)
+    item_size = payload_dtype.itemsize
+    offsets = np.fromiter(offsets, dtype=np.int64)
+    frames = np.zeros(len(offsets), dtype=frm2_dtype())
+    frames['offset'] = offsets
+    span_end = np.searchsorted(offsets, offsets+release_step, side='right')
+    ddb_array = np.frombuffer(ddb_data, dtype=np.uint8)
+    try:
+        releaser = PageReleaser(ddb_data)
+        i = 0
+        while i < len(offsets):
+            j = max(min(int(span_end[i]), i+frm2_batch), i+1)
+            releaser.advance(int(offsets[i]))
+            header = ddb_array[offsets[i:j, None]+np.arange(8)]
+            header = header.view(frm2_header_dtype).ravel()
+            assert (header['magic'] == b'FRM2').all()
+            frames['length'][i:j] = header['length']
+            i = j
+        payload_length = frames['length'].astype(np.int64)-8
+        frames['count'] = payload_length // item_size
+        frames['rest'] = payload_length % item_size
+        np.cumsum(frames['count'][:-1], out=frames['start'][1:])
+
+        # bytes of the whole items of every payload, in data
+        starts = np.zeros(len(offsets)+1, dtype=np.int64)
+        np.cumsum(payload_length-frames['rest'], out=starts[1:])
+        data = np.empty(starts[-1], dtype=np.uint8)
+        releaser = PageReleaser(ddb_data)
+        i = 0
+        while i < len(offsets):
+            # at least one frame, at most frm2_batch_bytes of payload
+            j = int(np.searchsorted(starts, starts[i]+frm2_batch_bytes,
+                                    side='right'))-1
+            j = max(min(j, int(span_end[i]), i+frm2_batch), i+1)
+            releaser.advance(int(offsets[i]))
+            gather = np.repeat(offsets[i:j]+8-starts[i:j],
+                               np.diff(starts[i:j+1]))
+            gather += np.arange(starts[i], starts[j])
+            data[starts[i]:starts[j]] = ddb_array[gather]
+            i = j
+    finally:
+        del ddb_array
+    return frames, data.view(payload_dtype)
+
+
+def save_frm2(dst_path: str, frames: np.ndarray, data: np.ndarray) -> None:
+    # one columnar file, frames fields and the payload as separate arrays
+    np.savez(dst_path, data=data,
+             **{name: frames[name] for name in frames.dtype.names})
+
+
+def load_frm2(src_path: str) -> tuple[np.ndarray, np.ndarray]:
+    with np.load(src_path) as npz_f:
+        frames = np.zeros(len(npz_f['offset']), dtype=frm2_dtype())
+        for name in frames.dtype.names:
+            frames[name] = npz_f[name]
+        return frames, npz_f['data']
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def imap_ordered(fn: Callable[[T], R], iterable: Iterable[T],
+                 workers: int, window: int = None) -> Iterator[R]:
+    # Like executor.map, but at most `window` results are pending at a time,
+    # so memory stays bounded when the consumer (one ordered writer) is slow.
+    window = workers*4 if window is None else window
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures: deque[Future[R]] = deque()
+        for item in iterable:
+            futures.append(executor.submit(fn, item))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import mmap
+import zipfile
+from utils.ddb_utils import iter_chunks
+from utils.stats_utils import stats
+from utils.zip_utils import ResumableZip, write_deflated
+
+from typing import Callable
+
+sink_type = Callable[[int, memoryview], None]
+
+
+class DdbScanner:
+    # Sends every chunk of one iter_chunks walk to the sinks registered for
+    # its type, so that all the outputs of a ddb take a single pass. A sink
+    # is called with (offset, chunk view) and must not keep the view.
+    def __init__(self, ddb_data: mmap.mmap | bytes):
+        self.ddb_data = ddb_data
+        self.sink_dict: dict[bytes, list[sink_type]] = {}
+
+    def add_sink(self, encode: bytes, sink: sink_type) -> None:
+        self.sink_dict.setdefault(encode, []).append(sink)
+
+    def scan(self, start: int = 0, end: int = None) -> None:
+        for encode, start_idx, chunk_data in iter_chunks(
+                self.ddb_data, tuple(self.sink_dict.keys()), start, end):
+            for sink in self.sink_dict[encode]:
+                sink(start_idx, chunk_data)
+
+
+class WavZipSink:
+    # SND chunks as the wav entries of a ResumableZip, see extract_wav.py
+    def __init__(self, zip_f: ResumableZip, length: int,
+                 date_time: tuple[int, int, int, int, int, int] = None):
+        self.zip_f = zip_f
+        self.length = length
+        self.date_time = date_time
+        self.counter = 0
+
+    def __call__(self, start_idx: int, chunk_data: memoryview) -> None:
+        identifier = int.from_bytes(chunk_data[14:18], byteorder='little')
+        with chunk_data[18:] as pcm_data:
+            self.write(start_idx, identifier, pcm_data)
+
+    def write(self, start_idx: int, identifier: int,
+              pcm_data: memoryview | bytes, entry: tuple = None) -> None:
+        # entry is the deflate_wav of a worker thread, if any
+        self.counter += 1
+        stats.progress(f'{self.counter:<10d} progress: '
+                       f'{start_idx+18+len(pcm_data):0>8x} / '
+                       f'{self.length:0>8x}')
+
+        # TODO: the filename should be reconsidered.
+        file_path = f'wav/{start_idx:016x}_{identifier:08x}.wav'
+        if entry is not None:
+            with stats.timer('write', size=len(pcm_data), records=1):
+                self.zip_f.write_deflated(*entry)
+            stats.progress('    wav saved at: ', file_path)
+            return
+        with stats.timer('check', size=len(pcm_data), records=1):
+            current = self.zip_f.is_current(file_path, pcm_data)
+        if current:
+            stats.progress('    wav kept at: ', file_path)
+            return
+        with stats.timer('write', size=len(pcm_data), records=1):
+            self.zip_f.write_wav(file_path, pcm_data, self.date_time)
+        stats.progress('    wav saved at: ', file_path)
+
+
+class Frm2ZipSink:
+    # FRM2 chunks as the raw entries of a zip, see extract_frm2.py
+    def __init__(self, zip_f: zipfile.ZipFile, length: int):
+        self.zip_f = zip_f
+        self.length = length
+        self.counter = 0
+
+    def __call__(self, start_idx: int, chunk_data: memoryview) -> None:
+        self.write(start_idx, chunk_data)
+
+    def write(self, start_idx: int, frm2_data: memoryview | bytes,
+              entry: tuple = None) -> None:
+        # entry is the deflate_entry of a worker thread, if any
+        self.counter += 1
+        stats.progress(f'{self.counter:<10d} progress: '
+                       f'{start_idx+len(frm2_data):0>8x} / '
+                       f'{self.length:0>8x}')
+
+        file_path = f'frm2/{start_idx:0>8x}.frm2'
+        with stats.timer('write', size=len(frm2_data), records=1):
+            if entry is None:
+                self.zip_f.writestr(file_path, frm2_data)
+            else:
+                write_deflated(self.zip_f, *entry)
+        stats.progress('    frm2 saved at: ', file_path)
+
+
+class ChunkIndexSink:
+    # offsets and lengths of the chunks of one type, in ddb order
+    def __init__(self):
+        self.offsets: list[int] = []
+        self.lengths: list[int] = []
+
+    def __call__(self, start_idx: int, chunk_data: memoryview) -> None:
+        self.offsets.append(start_idx)
+        self.lengths.append(len(chunk_data))
+
+
+def stats_sink(stage: str) -> sink_type:
+    # size and number of the chunks of one type, added to a stats stage
+    def sink(start_idx: int, chunk_data: memoryview) -> None:
+        stats.add(stage, size=len(chunk_data), records=1)
+    return sink
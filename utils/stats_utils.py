@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+
+class Stats:
+    # wall time, bytes and records accumulated per stage, see --stats
+    def __init__(self):
+        self.stage_dict: dict[str, dict[str, float | int]] = {}
+        self.quiet = False
+
+    def clear(self) -> None:
+        self.stage_dict.clear()
+
+    def progress(self, *args, **kwargs) -> None:
+        # per-sample progress lines, silenced by --quiet
+        if not self.quiet:
+            print(*args, **kwargs)
+
+    def add(self, stage: str, seconds: float = 0.0, size: int = 0,
+            records: int = 0) -> None:
+        stage_stats = self.stage_dict.setdefault(
+            stage, {'seconds': 0.0, 'bytes': 0, 'records': 0})
+        stage_stats['seconds'] += seconds
+        stage_stats['bytes'] += size
+        stage_stats['records'] += records
+
+    @contextmanager
+    def timer(self, stage: str, size: int = 0, records: int = 0
+              ) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter()-start, size, records)
+
+    def peak_memory(self) -> int | None:
+        # peak resident size of this process in bytes
+        if resource is None:
+            return None
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes, but in bytes on macOS
+        return max_rss if sys.platform == 'darwin' else max_rss*1024
+
+    def report(self) -> dict:
+        return {'stages': self.stage_dict, 'peak_memory': self.peak_memory()}
+
+    def dump(self, dst_path: str) -> None:
+        with open(dst_path, mode='w', encoding='utf-8') as stats_f:
+            json.dump(self.report(), stats_f, indent=2)
+
+
+stats = Stats()
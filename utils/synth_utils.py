@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import struct
+from utils.ddi_utils import float_magic, sample_magic
+
+# Synthetic ddi/ddb banks in the layout read_ddi and the ddb scanners expect,
+# for benchmarks only: pcm and frm2 payloads are random bytes.
+wav_rate = 44100
+phoneme_list = ['a', 'i', 'M', 'e', 'o', 'k', 's', 't', 'n', 'h', 'm', 'j',
+                'r', 'w', 'N', 'g', 'z', 'd', 'b', 'p', 'Sil', 'k\\', '@',
+                'tS']
+
+
+def _u32(value: int) -> bytes:
+    return struct.pack('<I', value)
+
+
+def _u64(value: int) -> bytes:
+    return struct.pack('<Q', value)
+
+
+def _str(value: str) -> bytes:
+    data = value.encode()
+    return _u32(len(data))+data
+
+
+def _arr(value: int) -> bytes:
+    return b'ARR '+_u32(0)+_u64(1)+_u32(value)
+
+
+def build_ddb(snd_num: int, frm2_per_snd: int = 2, pcm_frames: int = 2048,
+              frm2_size: int = 0x100, seed: int = 0
+              ) -> tuple[bytes, list[tuple[int, int]], list[list[int]]]:
+    # every SND chunk is preceded by its FRM2 chunks, chunk magics are
+    # scrubbed from the random payloads so that the scanners stay in sync
+    rng = random.Random(seed)
+    ddb = bytearray()
+    snd_list: list[tuple[int, int]] = []
+    frm2_list: list[list[int]] = []
+    for i in range(snd_num):
+        epr_offsets: list[int] = []
+        for j in range(frm2_per_snd):
+            epr_offsets.append(len(ddb))
+            payload = rng.randbytes(frm2_size-8).replace(b'SND ', b'snd ')
+            ddb += b'FRM2'+_u32(frm2_size)+payload.replace(b'FRM2', b'frm2')
+        frm2_list.append(epr_offsets)
+        identifier = rng.getrandbits(32)
+        frames = pcm_frames+rng.randrange(pcm_frames)
+        pcm = rng.randbytes(frames*2).replace(b'SND ', b'snd ')
+        pcm = pcm.replace(b'FRM2', b'frm2')
+        snd_list.append((len(ddb), identifier))
+        ddb += b'SND '+_u32(18+len(pcm))+_u32(wav_rate)+b'\x01\x00' \
+            + _u32(identifier)+pcm
+    return bytes(ddb), snd_list, frm2_list
+
+
+def _phdc(phoneme_list: list[str], hash_str: str) -> bytes:
+    body = _u32(4)+_u32(len(phoneme_list))
+    for i, phoneme in enumerate(phoneme_list):
+        body += phoneme.encode().ljust(0x1E, b'\x00')+bytes([i % 2])
+    phg2 = _u32(1)+_str('vowel')+_u32(len(phoneme_list))
+    for i, phoneme in enumerate(phoneme_list):
+        phg2 += _u32(i)+_str(phoneme)
+    phg2 += _u32(0)
+    category = b''
+    for i, phoneme in enumerate(phoneme_list[:4]):
+        category += phoneme.encode().rjust(1, b'x').ljust(0x20, b'\x00')
+        category += _u32(4)+b'\x00\x00\x00\x00\x00\x12\x34\x40'+b'\x00'*8
+    phdc_size = 0x10+0x1F*len(phoneme_list)+4+len(phg2)+len(category)
+    data = b'PHDC'+_u32(phdc_size)+body+b'PHG2'+_u32(len(phg2))+phg2
+    data += _u32(min(len(phoneme_list), 4))+category
+    data += hash_str.encode().ljust(0x20, b'0')+b'\x00'*0xE0
+    data += _u32(0)+_u32(2)
+    return data
+
+
+def _tdb(phoneme_list: list[str]) -> bytes:
+    data = b'\xFF'*8+b'TDB '+_u32(0)+_u64(1)+_u32(len(phoneme_list))
+    for i, phoneme in enumerate(phoneme_list):
+        data += b'\xFF'*8+b'TMM '+_u32(0)+_u64(1)+_u32(i)+_u32(3)
+        for name in ['pitch', 'dynamics', 'opening']:
+            data += b'\xFF'*8+_arr(0)+_str(name)
+        data += _str(phoneme)
+    return data+_str('timbre')
+
+
+def _epr(epr_offsets: list[int], prefix: bytes = b'') -> bytes:
+    data = prefix
+    data += _u32(len(epr_offsets))
+    for offset in epr_offsets:
+        data += _u64(offset)
+    return data
+
+
+def _stap(rng, idx: int, snd: tuple[int, int], epr_offsets: list[int]
+          ) -> bytes:
+    data = _u64(0)+b'STAp'+_u32(0)+_u32(0)+_u32(1)+rng.randbytes(0x12)
+    data += _u32(0)+float_magic+rng.randbytes(4)+_u32(0)+_u32(2)+_u64(0x3D)
+    data += b'EMPT'+_u32(0)+_str('SND')+_u32(rng.getrandbits(32))+_u32(0)
+    data += b'EMPT'+_u32(0)+_str('EpR')+_epr(epr_offsets, b'\xFF'*4)
+    data += sample_magic+_u32(snd[1])+_u64(snd[0]+0x812)
+    data += rng.randbytes(0xD)+b'\x00\x00\x00\x01'
+    data += str(idx).encode().ljust(4, b'\x00')
+    return data
+
+
+def _artp(rng, idx: int, snd: tuple[int, int], epr_offsets: list[int]
+          ) -> bytes:
+    data = _u64(0)+b'ARTp'+_u32(0)+_u32(0)+_u32(1)+rng.randbytes(0x12)
+    data += b'\x00'*4+float_magic+rng.randbytes(4)+_u32(2)+_u64(idx)
+    data += b'EMPT'+_u32(0)+_str('SND')+_u32(rng.getrandbits(32))+_u32(0)
+    data += b'EMPT'+_u32(0)+_str('EpR')
+    data += _epr(epr_offsets,
+                 _u32(len(epr_offsets)) if rng.random() < 0.5 else b'')
+    data += sample_magic+_u32(snd[1])+_u64(snd[0]+0x12)+_u64(snd[0]+0x800)
+    unknown2 = rng.randbytes(rng.randrange(0x10, 0x40))
+    unknown2 = unknown2.replace(b'default', b'DEFAULT')
+    return data+unknown2+_str('default')
+
+
+def _vqmp(rng, idx: int, snd: tuple[int, int], epr_offsets: list[int]
+          ) -> bytes:
+    data = b'\xFF'*8+b'VQMp'+_u32(0)+_u32(0)+_u32(1)+rng.randbytes(0x12)
+    data += b'\x00'*4+float_magic+rng.randbytes(4)+_u32(0)
+    data += _epr(epr_offsets, b'\xFF'*4)
+    data += sample_magic+_u32(snd[1])+_u64(snd[0])+b'\xFF'*0x10
+    return data+_str(str(idx))
+
+
+def build_ddi(phoneme_list: list[str], snd_list: list[tuple[int, int]],
+              frm2_list: list[list[int]], art_num: int = 8, artu_num: int = 4,
+              artp_num: int = 2, stap_num: int = 2, vqmp_num: int = 4,
+              hash_str: str = '0123456789abcdef0123456789abcdef',
+              seed: int = 0) -> bytes:
+    # samples are assigned round robin over snd_list
+    rng = random.Random(seed)
+    counter = 0
+
+    def next_snd():
+        nonlocal counter
+        idx = counter % len(snd_list)
+        counter += 1
+        return snd_list[idx], frm2_list[idx]
+
+    data = _u64(0)+b'DBSe'+_u32(0)+_u64(1)+_u32(3)
+    data += _phdc(phoneme_list, hash_str)
+    data += _tdb(phoneme_list)
+    data += b'\x00'*8+b'DBV '+_u32(0)+_u64(1)+_u32(5)
+
+    # STA
+    data += _u64(0)+_arr(1)+_u64(0)+b'STA '+_u32(0)+_u64(1)
+    data += _u32(len(phoneme_list))
+    for i, phoneme in enumerate(phoneme_list):
+        data += _u64(0)+b'STAu'+_u32(0)+_u32(1)+_u32(0)+_u32(i)
+        data += b'\xFF'*8+_u32(stap_num)
+        for j in range(stap_num):
+            data += _stap(rng, j, *next_snd())
+        data += _str(phoneme)
+    data += _str('normal')+_str('stationary')
+
+    # ART
+    def art_block(idx: int, depth: int) -> bytes:
+        block = b'ART '+_u32(0)+_u32(1)+_u32(0)+_u32(idx)+_u32(artu_num)
+        for j in range(artu_num):
+            block += _u64(0)
+            if depth == 0 and j % 2 == 1:
+                block += art_block(j, depth+1)
+                continue
+            block += b'ARTu'+_u32(0)+_u32(0)+_u32(0)+_u32(j)
+            block += _u64(j % 2)+b'\xFF'*8+_u32(artp_num)
+            for k in range(artp_num):
+                block += _artp(rng, k, *next_snd())
+            block += _str(phoneme_list[(idx+j+depth) % len(phoneme_list)])
+        return block+_str(phoneme_list[idx % len(phoneme_list)])
+
+    data += _u64(0)+_arr(art_num)
+    for i in range(art_num):
+        data += (b'\x00' if i == 0 or i % 2 else b'\xFF')*8+art_block(i, 0)
+    data += _str('articulation')
+
+    # VQM
+    if vqmp_num:
+        data += b'\xFF'*8+_arr(3)
+        for name in ['notetonote', 'attack', 'release']:
+            data += b'\xFF'*8+_arr(0)+_str(name)
+        data += _str('note')+b'\xFF'*8+_arr(0)+_str('vibrato')+b'\xFF'*8
+        data += b'VQM '+_u32(0)+_u32(1)+_u32(0)+_u32(1)+b'\xFF'*8
+        data += b'VQMu'+_u32(0)+_u32(1)+_u32(0)+_u32(vqmp_num)
+        data += _u32(vqmp_num)
+        for i in range(vqmp_num):
+            data += _vqmp(rng, i, *next_snd())
+        data += _str('GROWL')+_str('vqm')+_str('voice')
+    return data
+
+
+def synth_bank(dst_dir: str, scale: int = 1, name: str = 'bank',
+               seed: int = 0) -> tuple[str, str]:
+    # 64 samples and 12 top level ART blocks per scale unit
+    ddb_bytes, snd_list, frm2_list = build_ddb(64*scale, pcm_frames=1024,
+                                               seed=seed)
+    ddi_bytes = build_ddi(phoneme_list, snd_list, frm2_list,
+                          art_num=12*scale, artu_num=6, artp_num=3,
+                          stap_num=2, vqmp_num=5, seed=seed)
+    os.makedirs(dst_dir, exist_ok=True)
+    ddi_path = os.path.join(dst_dir, name+'.ddi')
+    ddb_path = os.path.join(dst_dir, name+'.ddb')
+    with open(ddi_path, 'wb') as ddi_f:
+        ddi_f.write(ddi_bytes)
+    with open(ddb_path, 'wb') as ddb_f:
+        ddb_f.write(ddb_bytes)
+    return ddi_path, ddb_path
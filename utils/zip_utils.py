@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+import zipfile
+import time
+import zlib
+from utils.ddb_utils import (set_compress_level, wav_header,
+                             wav_header_struct, write_wav)
+
+from typing import Iterable
+
+manifest_ext = '.manifest'
+# the kept entries are moved over the space of replaced ones once it is
+# more than this part of the zip, copy_step bytes at a time
+compact_ratio = 0.25
+copy_step = 1 << 20
+compression_types = {'stored': zipfile.ZIP_STORED,
+                     'deflate': zipfile.ZIP_DEFLATED}
+zinfo_fields = ['filename', 'date_time', 'compress_type', 'header_offset',
+                'CRC', 'compress_size', 'file_size', 'flag_bits',
+                'external_attr', 'create_version', 'extract_version']
+# ZipFile internals used by write_deflated and ResumableZip.abort are checked
+# on these python versions. On the others, the worker threads only read the
+# entries and the writer deflates them itself, and abort writes the central
+# directory through a new ZipFile.
+zipfile_internals = (3, 10) <= sys.version_info[:2] <= (3, 13)
+
+
+def wav_crc(pcm_data: memoryview | bytes) -> int:
+    # crc of the whole wav entry, as stored in the zip
+    return zlib.crc32(pcm_data, zlib.crc32(wav_header(len(pcm_data))))
+
+
+def deflate_entry(file_path: str, data_list: Iterable[memoryview | bytes],
+                  date_time: tuple[int, int, int, int, int, int] = None,
+                  compress_level: int = None
+                  ) -> tuple[zipfile.ZipInfo, bytes]:
+    # The same raw deflate stream zipfile writes for the entry, so that it
+    # can be made in a worker thread (zlib releases the GIL) and appended
+    # by write_deflated in the writer thread.
+    if date_time is None:
+        date_time = time.localtime(time.time())[:6]
+    zinfo = zipfile.ZipInfo(file_path, date_time=date_time)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0o600 << 16
+    if not zipfile_internals:
+        set_compress_level(zinfo, compress_level)
+        data = b''.join(data_list)
+        zinfo.file_size = len(data)
+        return zinfo, data
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION if compress_level is None
+        else compress_level, zlib.DEFLATED, -15)
+    compressed_list: list[bytes] = []
+    crc = 0
+    for data in data_list:
+        crc = zlib.crc32(data, crc)
+        zinfo.file_size += len(data)
+        compressed_list.append(compressor.compress(data))
+    compressed_list.append(compressor.flush())
+    compressed_data = b''.join(compressed_list)
+    zinfo.CRC = crc
+    zinfo.compress_size = len(compressed_data)
+    return zinfo, compressed_data
+
+
+def deflate_wav(file_path: str, pcm_data: memoryview | bytes,
+                date_time: tuple[int, int, int, int, int, int] = None,
+                compress_level: int = None
+                ) -> tuple[zipfile.ZipInfo, bytes]:
+    return deflate_entry(file_path, [wav_header(len(pcm_data)), pcm_data],
+                         date_time, compress_level)
+
+
+def write_deflated(zip_f: zipfile.ZipFile, zinfo: zipfile.ZipInfo,
+                   compressed_data: bytes) -> None:
+    # appends an entry of deflate_entry as it is, the same bytes as
+    # zip_f.open(zinfo, mode='w') would write
+    if not zipfile_internals:
+        # the data is not compressed yet
+        with zip_f.open(zinfo, mode='w') as entry_f:
+            entry_f.write(compressed_data)
+        return
+    zip64 = zinfo.file_size*1.05 > zipfile.ZIP64_LIMIT
+    if zip64 and not zip_f._allowZip64:
+        raise zipfile.LargeZipFile('Filesize would require ZIP64 extensions')
+    with zip_f._lock:
+        if zip_f._seekable:
+            zip_f.fp.seek(zip_f.start_dir)
+        zinfo.header_offset = zip_f.fp.tell()
+        zip_f._writecheck(zinfo)
+        zip_f._didModify = True
+        zip_f.fp.write(zinfo.FileHeader(zip64))
+        zip_f.fp.write(compressed_data)
+        zip_f.start_dir = zip_f.fp.tell()
+        zip_f.filelist.append(zinfo)
+        zip_f.NameToInfo[zinfo.filename] = zinfo
+
+
+def load_manifest(manifest_path: str) -> dict[str, dict]:
+    # entry name -> last record, a torn last line of a killed run is ignored
+    record_dict: dict[str, dict] = {}
+    with open(manifest_path, mode='r', encoding='utf-8') as manifest_f:
+        for line in manifest_f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            record_dict[record['filename']] = record
+    return record_dict
+
+
+def record_zinfo(record: dict) -> zipfile.ZipInfo:
+    zinfo = zipfile.ZipInfo(record['filename'],
+                            date_time=tuple(record['date_time']))
+    for field in zinfo_fields[2:]:
+        setattr(zinfo, field, record[field])
+    return zinfo
+
+
+class ResumableZip:
+    # A ZipFile whose entries are logged to "[dst_path].manifest" once they
+    # are on disk. When the zip is opened again, the entries of the manifest
+    # are kept, the bytes after the last one (a torn entry, or the central
+    # directory of a finished run) are cut off, and only the samples that
+    # are missing or changed are written again.
+    def __init__(self, dst_path: str, resume: bool = True,
+                 compression: int = zipfile.ZIP_STORED,
+                 compress_level: int = None):
+        self.dst_path = dst_path
+        self.manifest_path = dst_path+manifest_ext
+        record_dict: dict[str, dict] = {}
+        if resume and os.path.isfile(dst_path) \
+                and os.path.isfile(self.manifest_path):
+            record_dict = load_manifest(self.manifest_path)
+        end = max((record['end'] for record in record_dict.values()),
+                  default=0)
+        # the deflate level of the entries, None if they are stored
+        self.compress_level = None if compression == zipfile.ZIP_STORED \
+            else compress_level
+        # a zip of another compression or level is written again from
+        # scratch
+        if record_dict and (end > os.path.getsize(dst_path) or any(
+                record['compress_type'] != compression
+                or record['compress_level'] != self.compress_level
+                for record in record_dict.values())):
+            record_dict = {}
+
+        if record_dict:
+            self.zip_fp = open(dst_path, 'r+b')
+            live_size = sum(record['end']-record['header_offset']
+                            for record in record_dict.values())
+            if end-live_size > compact_ratio*end:
+                end = self._compact(record_dict)
+            self.zip_fp.seek(end)
+            self.zip_fp.truncate()
+        else:
+            self.zip_fp = open(dst_path, 'w+b')
+        self.zip_f = zipfile.ZipFile(self.zip_fp, 'w', compression=compression,
+                                     compresslevel=compress_level)
+        for record in record_dict.values():
+            zinfo = record_zinfo(record)
+            self.zip_f.filelist.append(zinfo)
+            self.zip_f.NameToInfo[zinfo.filename] = zinfo
+        self.record_dict = record_dict
+        # entries of this run in source order, the central directory
+        # follows it so that a resumed zip lists them like a fresh one
+        self.kept: dict[str, None] = {}
+        # rewritten, a torn last line must not be followed by new records
+        self.manifest_f = open(self.manifest_path, mode='w', encoding='utf-8')
+        for record in record_dict.values():
+            self.manifest_f.write(json.dumps(record)+'\n')
+        self.manifest_f.flush()
+
+    def _compact(self, record_dict: dict[str, dict]) -> int:
+        # The manifest is removed first, so that a run interrupted while
+        # the entries are moved starts again from scratch. The records are
+        # updated in place and the new end is returned.
+        os.remove(self.manifest_path)
+        end = 0
+        for record in sorted(record_dict.values(),
+                             key=lambda record: record['header_offset']):
+            start = record['header_offset']
+            size = record['end']-start
+            if start != end:
+                for i in range(0, size, copy_step):
+                    self.zip_fp.seek(start+i)
+                    data = self.zip_fp.read(min(copy_step, size-i))
+                    self.zip_fp.seek(end+i)
+                    self.zip_fp.write(data)
+            record['header_offset'] = end
+            record['end'] = end = end+size
+        return end
+
+    def __enter__(self) -> 'ResumableZip':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def matches(self, file_path: str, pcm_data: memoryview | bytes) -> bool:
+        # True if the entry of the previous run holds the same wav,
+        # safe to call from worker threads
+        record = self.record_dict.get(file_path)
+        file_size = wav_header_struct.size+len(pcm_data)
+        return record is not None and record['file_size'] == file_size \
+            and record['CRC'] == wav_crc(pcm_data)
+
+    def is_current(self, file_path: str, pcm_data: memoryview | bytes
+                   ) -> bool:
+        if not self.matches(file_path, pcm_data):
+            return False
+        self.kept[file_path] = None
+        return True
+
+    def write_wav(self, file_path: str, pcm_data: memoryview | bytes,
+                  date_time: tuple[int, int, int, int, int, int] = None
+                  ) -> None:
+        self._drop(file_path)
+        write_wav(self.zip_f, file_path, pcm_data, date_time)
+        self._record(file_path)
+
+    def write_deflated(self, zinfo: zipfile.ZipInfo, compressed_data: bytes
+                       ) -> None:
+        # an entry of deflate_wav, compressed in a worker thread
+        self._drop(zinfo.filename)
+        write_deflated(self.zip_f, zinfo, compressed_data)
+        self._record(zinfo.filename)
+
+    def _record(self, file_path: str) -> None:
+        self.kept[file_path] = None
+        # the entry has to be on disk before its manifest line
+        self.zip_fp.flush()
+        zinfo = self.zip_f.NameToInfo[file_path]
+        record = {field: getattr(zinfo, field) for field in zinfo_fields}
+        record['compress_level'] = self.compress_level
+        record['end'] = self.zip_fp.tell()
+        self.record_dict[file_path] = record
+        self.manifest_f.write(json.dumps(record)+'\n')
+        self.manifest_f.flush()
+
+    def _drop(self, file_path: str) -> None:
+        if (zinfo := self.zip_f.NameToInfo.pop(file_path, None)) is not None:
+            self.zip_f.filelist.remove(zinfo)
+
+    def abort(self) -> None:
+        # keep everything written so far, readable and resumable, but not
+        # an entry torn by the interruption
+        for file_path in list(self.zip_f.NameToInfo.keys()):
+            if file_path not in self.record_dict:
+                self._drop(file_path)
+        end = max((record['end'] for record in self.record_dict.values()),
+                  default=0)
+        if zipfile_internals:
+            # a write handle left open by the interruption is discarded, the
+            # central directory goes right after the last recorded entry
+            self.zip_f._writing = False
+            self.zip_f.start_dir = end
+            self.zip_f.close()
+        else:
+            try:
+                self.zip_f.close()
+            except ValueError:
+                # a write handle is still open, the central directory of the
+                # recorded entries is written by a new ZipFile after them
+                self.zip_f.fp = None
+                self.zip_fp.seek(end)
+                zip_f = zipfile.ZipFile(self.zip_fp, 'w')
+                zip_f.filelist = self.zip_f.filelist
+                zip_f.NameToInfo = self.zip_f.NameToInfo
+                zip_f.close()
+        self.zip_fp.truncate()
+        self.zip_fp.close()
+        self.manifest_f.close()
+
+    def close(self) -> None:
+        # entries of the previous run that are gone from the source are
+        # dropped from the central directory and the manifest
+        self.zip_f.filelist = [self.zip_f.NameToInfo[file_path]
+                               for file_path in self.kept.keys()]
+        self.zip_f.NameToInfo = {zinfo.filename: zinfo
+                                 for zinfo in self.zip_f.filelist}
+        self.zip_f.close()
+        self.zip_fp.close()
+        self.manifest_f.close()
+        with open(self.manifest_path, mode='w',
+                  encoding='utf-8') as manifest_f:
+            for file_path in self.zip_f.NameToInfo.keys():
+                record = self.record_dict[file_path]
+                manifest_f.write(json.dumps(record)+'\n')